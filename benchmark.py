@@ -0,0 +1,244 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import threading
+import time
+from io import BytesIO
+
+from openpyxl.drawing.image import Image
+from PIL import Image as PILImage
+
+import fixture_site
+import main
+import mock_openai
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+BASELINE_PATH = 'benchmark_baseline.json'
+BENCHMARK_DIR = '.benchmark'
+REGRESSION_TOLERANCE = 0.2
+
+
+def generate_samples(count, seed=0):
+    rng = random.Random(seed)
+    samples = []
+    for index in range(count):
+        width = rng.choice((320, 800, 1600, 2400))
+        height = int(width * rng.choice((0.5, 0.75, 1.0)))
+        img = PILImage.new('RGB', (width, height), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        img.paste(PILImage.effect_noise((width // 4, height // 4), 64).convert('RGB').resize((width, height)))
+        buffer = BytesIO()
+        if index % 3 == 2:
+            img.save(buffer, format='PNG')
+        else:
+            img.save(buffer, format='JPEG', quality=85)
+        samples.append(buffer.getvalue())
+    return samples
+
+
+def legacy_thumbnail(index, data):
+    img = PILImage.open(BytesIO(data))
+    img_filename = f'benchmarkimage{index + 1}.png'
+    img.save(img_filename)
+    try:
+        new_width, new_height = main.resize_image(img_filename)
+        Image(img_filename)._data()
+        return new_width, new_height
+    finally:
+        os.remove(img_filename)
+
+
+def bench_thumbnails(count=200, workers=main.THUMBNAIL_WORKERS):
+    samples = generate_samples(count)
+    image_bytes = {f'sample{index}': data for index, data in enumerate(samples)}
+    results = {}
+
+    started = time.perf_counter()
+    for index, data in enumerate(samples):
+        legacy_thumbnail(index, data)
+    results['legacy temp files'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    main.make_thumbnails(image_bytes, workers=1)
+    results['in-memory'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    main.make_thumbnails(image_bytes, workers=workers)
+    results[f'in-memory, {workers} processes'] = time.perf_counter() - started
+
+    baseline = results['legacy temp files']
+    print(f'Thumbnail benchmark: {count} images')
+    for name, elapsed in results.items():
+        print(f'  {name:<32} {elapsed:8.2f}s  {count / elapsed:8.1f} images/s  {baseline / elapsed:5.1f}x')
+    return results
+
+
+def current_rss_mb():
+    if main.psutil is not None:
+        process = main.psutil.Process()
+        total = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except main.psutil.Error:
+                pass
+        return total / 1024 ** 2
+    if resource is not None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return 0.0
+
+
+class PeakMemory:
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name='peak-memory', daemon=True)
+
+    def _sample(self):
+        while True:
+            self.peak_mb = max(self.peak_mb, current_rss_mb())
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def measure(results, stage, task, unit, count):
+    logging.warning(f'Benchmarking {stage}')
+    with PeakMemory() as memory:
+        started = time.perf_counter()
+        value = task()
+        elapsed = time.perf_counter() - started
+    items = count(value)
+    results[stage] = {
+        'seconds': round(elapsed, 3),
+        'items': items,
+        'unit': unit,
+        'rate': round(items / elapsed, 3) if elapsed else 0.0,
+        'peak_rss_mb': round(memory.peak_mb, 1),
+    }
+    return value
+
+
+def compare_with_baseline(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    if baseline['config'] != results['config']:
+        print('Baseline was recorded with a different configuration, skipping comparison')
+        return []
+    regressions = []
+    print(f'Compared with baseline from {baseline["recorded_at"]}:')
+    for stage, current in results['stages'].items():
+        previous = baseline['stages'].get(stage)
+        if previous is None:
+            continue
+        change = (current['seconds'] - previous['seconds']) / previous['seconds'] if previous['seconds'] else 0.0
+        flag = ''
+        if change > tolerance:
+            regressions.append(stage)
+            flag = '  REGRESSION'
+        print(f'  {stage:<16} {previous["seconds"]:8.2f}s -> {current["seconds"]:8.2f}s ({change:+.0%}){flag}')
+    return regressions
+
+
+def bench_site(pages=50, fanout=4, images_per_page=6, lazy_images=2, js_images=2, slow_every=10, slow_delay=0.5,
+               alt_latency=0.2, workdir=BENCHMARK_DIR, baseline_path=BASELINE_PATH, update_baseline=False,
+               tolerance=REGRESSION_TOLERANCE):
+    config = {'pages': pages, 'fanout': fanout, 'images_per_page': images_per_page, 'lazy_images': lazy_images,
+              'js_images': js_images, 'slow_every': slow_every, 'slow_delay': slow_delay, 'alt_latency': alt_latency}
+    site = fixture_site.serve_fixture_site(pages=pages, fanout=fanout, images_per_page=images_per_page,
+                                           lazy_images=lazy_images, js_images=js_images, slow_every=slow_every,
+                                           slow_delay=slow_delay)
+    completions = mock_openai.serve_mock_completions(latency=alt_latency, jitter=0.0)
+    main.CHATGPT_API_URL = completions.url
+    os.makedirs(workdir, exist_ok=True)
+    excel_path = os.path.join(workdir, 'benchmark.xlsx')
+    if os.path.exists(excel_path):
+        os.remove(excel_path)
+
+    stages = {}
+    started = time.perf_counter()
+    try:
+        with main.DriverPool() as pool:
+            links = measure(stages, 'get_links2', lambda: main.get_links2(site.url, pool=pool), 'pages', len)
+            images = measure(stages, 'scrape_images', lambda: main.scrape_images(links, pool=pool), 'images', len)
+        image_bytes = measure(stages, 'write_to_excel', lambda: main.write_to_excel(images, excel_path, 'Images'),
+                              'images', lambda _: len(images))
+        scheduler = main.AltTextScheduler(requests_per_minute=10 ** 6, tokens_per_minute=10 ** 9)
+        measure(stages, 'alt_writer',
+                lambda: main.alt_writer(excel_path, 'Images', None, image_bytes=image_bytes, scheduler=scheduler),
+                'images', lambda _: len(images))
+    finally:
+        site.shutdown()
+        completions.shutdown()
+    results = {
+        'recorded_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'config': config,
+        'wall_seconds': round(time.perf_counter() - started, 3),
+        'stages': stages,
+    }
+
+    print(f'Site benchmark: {pages} pages, {images_per_page + lazy_images + js_images} images per page')
+    for stage, result in stages.items():
+        print(f'  {stage:<16} {result["seconds"]:8.2f}s  {result["rate"]:8.2f} {result["unit"]}/s  '
+              f'{result["items"]:6d} {result["unit"]}  peak {result["peak_rss_mb"]:8.1f}MB')
+    print(f'  {"total":<16} {results["wall_seconds"]:8.2f}s')
+
+    regressions = []
+    if os.path.exists(baseline_path) and not update_baseline:
+        with open(baseline_path) as f:
+            regressions = compare_with_baseline(results, json.load(f), tolerance)
+    else:
+        with open(baseline_path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Stored baseline in {baseline_path}')
+    return results, regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='Benchmarks for the screenshot automation pipeline')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    thumbnails = subparsers.add_parser('thumbnails', help='Compare the legacy and in-memory thumbnail paths')
+    thumbnails.add_argument('--count', type=int, default=200)
+    thumbnails.add_argument('--workers', type=int, default=main.THUMBNAIL_WORKERS)
+    site = subparsers.add_parser('site', help='Crawl, scrape and describe a generated local fixture site')
+    site.add_argument('--pages', type=int, default=50)
+    site.add_argument('--fanout', type=int, default=4)
+    site.add_argument('--images-per-page', type=int, default=6)
+    site.add_argument('--lazy-images', type=int, default=2)
+    site.add_argument('--js-images', type=int, default=2)
+    site.add_argument('--slow-every', type=int, default=10)
+    site.add_argument('--slow-delay', type=float, default=0.5)
+    site.add_argument('--alt-latency', type=float, default=0.2)
+    site.add_argument('--workdir', default=BENCHMARK_DIR)
+    site.add_argument('--baseline', default=BASELINE_PATH)
+    site.add_argument('--update-baseline', action='store_true')
+    site.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE,
+                      help='Allowed slowdown per stage before it is reported as a regression')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    if args.command == 'thumbnails':
+        bench_thumbnails(args.count, args.workers)
+    elif args.command == 'site':
+        _, regressions = bench_site(args.pages, args.fanout, args.images_per_page, args.lazy_images, args.js_images,
+                                    args.slow_every, args.slow_delay, args.alt_latency, args.workdir, args.baseline,
+                                    args.update_baseline, args.tolerance)
+        if regressions:
+            raise SystemExit(f'Regressions in: {", ".join(regressions)}')
+
+
+if __name__ == '__main__':
+    main_cli()
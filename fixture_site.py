@@ -0,0 +1,171 @@
+import argparse
+import logging
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+from PIL import Image as PILImage
+
+PLACEHOLDER_GIF = 'data:image/gif;base64,R0lGODlhAQABAAAAACH5BAEKAAEALAAAAAABAAEAAAICTAEAOw=='
+PAGE_PATTERN = re.compile(r'^/(?:page/(\d+)\.html)?$')
+IMAGE_PATTERN = re.compile(r'^/img/([\w-]+)\.(png|jpg)$')
+
+
+def page_links(number, pages, fanout, seed):
+    rng = random.Random(seed * 100003 + number)
+    children = [child for child in range(number * fanout + 1, number * fanout + fanout + 1) if child < pages]
+    return [0, *children, rng.randrange(pages)]
+
+
+def render_page(number, pages, fanout, images_per_page, lazy_images, js_images, seed):
+    links = ''.join(f'<li><a href="/page/{link}.html">Page {link}</a></li>' for link in page_links(
+        number, pages, fanout, seed))
+    images = ''.join(f'<img src="/img/p{number}-{index}.jpg" alt="Photo {index} on page {number}">'
+                     for index in range(images_per_page))
+    lazy = ''.join(f'<img class="lazy" src="{PLACEHOLDER_GIF}" data-src="/img/p{number}-lazy{index}.jpg" alt="">'
+                   for index in range(lazy_images))
+    js = ''.join(f'"/img/p{number}-js{index}.png",' for index in range(js_images))
+    return f"""<!DOCTYPE html>
+<html>
+<head><title>Fixture page {number}</title></head>
+<body>
+<header><img src="/img/logo.png" alt="Logo"></header>
+<nav><ul>{links}</ul></nav>
+<main>
+<section class="gallery">{images}</section>
+<button onclick="document.getElementById('more').style.display='block'">Show more</button>
+<div id="more" style="display:none"><img src="/img/p{number}-hidden.png" alt="Hidden photo"></div>
+<div style="height:3000px"></div>
+<section class="lazy-gallery">{lazy}</section>
+<section id="js-gallery"></section>
+</main>
+<script>
+const observer = new IntersectionObserver(entries => entries.forEach(entry => {{
+    if (entry.isIntersecting) {{
+        entry.target.src = entry.target.dataset.src;
+        observer.unobserve(entry.target);
+    }}
+}}));
+document.querySelectorAll('img.lazy').forEach(img => observer.observe(img));
+setTimeout(() => {{
+    for (const src of [{js}]) {{
+        const img = document.createElement('img');
+        img.src = src;
+        img.alt = '';
+        document.getElementById('js-gallery').appendChild(img);
+    }}
+}}, 300);
+</script>
+</body>
+</html>
+"""
+
+
+def render_image(name, extension):
+    rng = random.Random(name)
+    width = rng.choice((200, 480, 800, 1200))
+    height = int(width * rng.choice((0.5, 0.75, 1.0)))
+    img = PILImage.new('RGB', (width, height), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    img.paste(PILImage.effect_noise((width // 8, height // 8), 48).convert('RGB').resize((width, height)))
+    buffer = BytesIO()
+    if extension == 'png':
+        img.save(buffer, format='PNG')
+    else:
+        img.save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def make_handler(pages, fanout, images_per_page, lazy_images, js_images, slow_every, slow_delay, seed, stats):
+    images = {}
+    images_lock = threading.Lock()
+
+    class FixtureSiteHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split('?', 1)[0]
+            page_match = PAGE_PATTERN.match(path)
+            if page_match:
+                number = int(page_match.group(1) or 0)
+                if number >= pages:
+                    self._send(404, b'Not found', 'text/plain')
+                    return
+                if slow_every and number % slow_every == slow_every - 1:
+                    time.sleep(slow_delay)
+                body = render_page(number, pages, fanout, images_per_page, lazy_images, js_images, seed)
+                with stats['lock']:
+                    stats['pages'] += 1
+                self._send(200, body.encode('utf-8'), 'text/html; charset=utf-8')
+                return
+
+            image_match = IMAGE_PATTERN.match(path)
+            if image_match:
+                name, extension = image_match.groups()
+                with images_lock:
+                    data = images.get(path)
+                if data is None:
+                    data = render_image(f'{seed}-{name}', extension)
+                    with images_lock:
+                        images[path] = data
+                with stats['lock']:
+                    stats['images'] += 1
+                    stats['bytes'] += len(data)
+                self._send(200, data, 'image/png' if extension == 'png' else 'image/jpeg')
+                return
+
+            self._send(404, b'Not found', 'text/plain')
+
+        def _send(self, status, data, content_type):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.send_header('Cache-Control', 'max-age=3600')
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            logging.debug(f'Fixture site: {format % args}')
+
+    return FixtureSiteHandler
+
+
+def serve_fixture_site(port=0, pages=50, fanout=4, images_per_page=6, lazy_images=2, js_images=2, slow_every=10,
+                       slow_delay=0.5, seed=0):
+    stats = {'pages': 0, 'images': 0, 'bytes': 0, 'lock': threading.Lock()}
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(
+        pages, fanout, images_per_page, lazy_images, js_images, slow_every, slow_delay, seed, stats))
+    server.daemon_threads = True
+    server.stats = stats
+    server.url = f'http://127.0.0.1:{server.server_port}/'
+    thread = threading.Thread(target=server.serve_forever, name='fixture-site', daemon=True)
+    thread.start()
+    logging.info(f'Fixture site with {pages} pages listening on {server.url}')
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generated local website for crawler and scraper benchmarks')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--fanout', type=int, default=4)
+    parser.add_argument('--images-per-page', type=int, default=6)
+    parser.add_argument('--lazy-images', type=int, default=2)
+    parser.add_argument('--js-images', type=int, default=2)
+    parser.add_argument('--slow-every', type=int, default=10)
+    parser.add_argument('--slow-delay', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S')
+    server = serve_fixture_site(args.port, args.pages, args.fanout, args.images_per_page, args.lazy_images,
+                                args.js_images, args.slow_every, args.slow_delay, args.seed)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,28 @@
+import argparse
+import base64
+import csv
+import glob
+import gzip
+import hashlib
+import json
 import os
+import random
+import queue
+import re
+import sqlite3
+import threading
 import time
-from io import BytesIO
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager, nullcontext
+from datetime import datetime, timezone
+from fnmatch import fnmatchcase
+from html.parser import HTMLParser
+from io import BufferedReader, BytesIO
 from selenium import webdriver
-from selenium.common import StaleElementReferenceException, TimeoutException
 from selenium.webdriver.chrome.service import Service
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.chrome.options import Options
@@ -11,12 +30,31 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
 from openpyxl import Workbook, load_workbook
 from openpyxl.drawing.image import Image
-from urllib.parse import urlparse, urljoin
+from urllib.parse import parse_qsl, urlencode, urlparse, urljoin, urlsplit, urlunsplit
+from xml.etree import ElementTree
 from PIL import Image as PILImage
 
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import cairosvg
+except ImportError:
+    cairosvg = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
 
 logging.basicConfig(
     level=logging.INFO,
@@ -25,42 +63,652 @@ logging.basicConfig(
 )
 
 CHATGPT_API_KEY = 'xxxxxxx'
+CHATGPT_API_URL = os.environ.get('CHATGPT_API_URL', 'https://api.openai.com/v1/chat/completions')
+CHATGPT_MODEL = 'gpt-4o'
+CHATGPT_MAX_TOKENS = 2000
+CHATGPT_TEMPERATURE = 0.7
+ALT_CONCURRENCY = 4
+ALT_REQUESTS_PER_MINUTE = 500
+ALT_TOKENS_PER_MINUTE = 30000
+ALT_MAX_RETRIES = 5
+ALT_MAX_TOKENS = 150
+ALT_LATENCY_SAMPLES = 1000
+ALT_PROMPT_VERSION = 1
+ALT_CACHE_PATH = 'alt_cache.sqlite'
+ALT_CACHE_TTL = 90 * 24 * 3600
+ALT_CACHE_MAX_ENTRIES = 200000
+ALT_ERROR_TEXT = 'Error generating alt text'
+THUMBNAIL_SIZE = (100, 100)
+REPORT_COLUMNS = ['Src', 'Url', 'Alt']
+REPORT_ROWS_PER_PART = 5000
+REPORT_CHUNK_SIZE = 200
+THUMBNAIL_WORKERS = os.cpu_count() or 1
+THUMBNAIL_POOL_MIN_IMAGES = 16
+DHASH_SIZE = 8
+PHASH_MAX_DISTANCE = 8
+PHASH_MIN_SIDE = 32
+PHASH_MIN_CONTRAST = 16
+PHASH_ASPECT_TOLERANCE = 0.1
+AUDIT_QUALITY = 80
+AUDIT_AVIF_SPEED = 8
+AUDIT_MIN_BYTES = 2048
+AUDIT_COLUMNS = ['Bytes', 'Format', 'Intrinsic Size', 'Rendered Size', 'WebP Bytes', 'AVIF Bytes', 'Potential Savings']
+SETTLE_QUIET_MS = 500
+SETTLE_TIMEOUT = 15
+SETTLE_SCRIPT = """
+var quietMs = arguments[0], timeoutMs = arguments[1], scroll = arguments[2];
+var done = arguments[arguments.length - 1];
+var start = Date.now(), lastChange = Date.now(), y = window.scrollY;
+
+if (!window.__altWriterSettle) {
+    window.__altWriterSettle = {pending: 0};
+    var state = window.__altWriterSettle;
+    if (window.fetch) {
+        var originalFetch = window.fetch;
+        window.fetch = function () {
+            state.pending++;
+            return originalFetch.apply(this, arguments).finally(function () { state.pending--; });
+        };
+    }
+    var originalSend = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+        state.pending++;
+        this.addEventListener('loadend', function () { state.pending--; }, {once: true});
+        return originalSend.apply(this, arguments);
+    };
+}
+
+var markChange = function () { lastChange = Date.now(); };
+var mutations = new MutationObserver(markChange);
+mutations.observe(document.documentElement, {
+    childList: true, subtree: true, attributes: true, attributeFilter: ['src', 'srcset', 'style', 'class']
+});
+var resources = null;
+if (window.PerformanceObserver) {
+    resources = new PerformanceObserver(markChange);
+    try { resources.observe({type: 'resource'}); } catch (e) { resources = null; }
+}
+
+function pendingImages() {
+    var count = 0;
+    for (var i = 0; i < document.images.length; i++) {
+        var img = document.images[i];
+        if (!img.complete && img.loading !== 'lazy') count++;
+    }
+    return count;
+}
+
+function finish(settled) {
+    mutations.disconnect();
+    if (resources) resources.disconnect();
+    if (scroll) window.scrollTo(0, 0);
+    done({
+        settled: settled,
+        elapsed: Date.now() - start,
+        height: document.body ? document.body.scrollHeight : 0,
+        pendingRequests: window.__altWriterSettle.pending,
+        pendingImages: pendingImages()
+    });
+}
+
+function tick() {
+    var now = Date.now();
+    if (now - start > timeoutMs) return finish(false);
+    var height = document.body ? document.body.scrollHeight : 0;
+    if (scroll && y + window.innerHeight < height) {
+        y += window.innerHeight;
+        window.scrollTo(0, y);
+        lastChange = now;
+    } else if (now - lastChange >= quietMs && window.__altWriterSettle.pending <= 0 && pendingImages() === 0) {
+        return finish(true);
+    }
+    setTimeout(tick, 100);
+}
+tick();
+"""
+CLICKABLE_SELECTOR = "*[onclick], button, [role='button'], a[href], [style='cursor: pointer']"
+EXPLORE_MAX_CLICKS = 30
+EXPLORE_MAX_SECONDS = 60
+VOLATILE_ATTRIBUTES = {'style', 'class', 'tabindex', 'aria-expanded', 'aria-selected', 'aria-pressed',
+                       'aria-hidden', 'aria-current', 'data-state'}
+HARVEST_SCRIPT = """
+var clickableSelector = arguments[0];
+function cssPath(element) {
+    var parts = [];
+    while (element && element.nodeType === 1 && element !== document.documentElement) {
+        if (element.id && document.querySelectorAll('#' + CSS.escape(element.id)).length === 1) {
+            parts.unshift('#' + CSS.escape(element.id));
+            break;
+        }
+        var index = 1, sibling = element;
+        while ((sibling = sibling.previousElementSibling)) {
+            if (sibling.tagName === element.tagName) index++;
+        }
+        parts.unshift(element.tagName.toLowerCase() + ':nth-of-type(' + index + ')');
+        element = element.parentElement;
+    }
+    return parts.join(' > ');
+}
+var images = Array.from(document.images).map(function (img) {
+    var rect = img.getBoundingClientRect();
+    return {
+        src: img.getAttribute('src') === null ? null : img.src,
+        currentSrc: img.currentSrc || null,
+        srcset: img.getAttribute('srcset'),
+        alt: img.getAttribute('alt'),
+        dataSrc: img.getAttribute('data-src') || img.getAttribute('data-lazy-src') || img.getAttribute('data-original'),
+        dataSrcset: img.getAttribute('data-srcset'),
+        naturalWidth: img.naturalWidth,
+        naturalHeight: img.naturalHeight,
+        renderedWidth: Math.round(rect.width),
+        renderedHeight: Math.round(rect.height)
+    };
+});
+var clickables = Array.from(document.querySelectorAll(clickableSelector)).map(function (element) {
+    var attributes = {tag: element.tagName.toLowerCase()};
+    Array.from(element.attributes).forEach(function (attr) {
+        attributes[attr.name] = attr.value;
+    });
+    var rect = element.getBoundingClientRect();
+    return {
+        attributes: attributes,
+        href: element.getAttribute('href') === null ? null : element.href,
+        rawHref: element.getAttribute('href'),
+        text: (element.innerText || element.value || '').trim().slice(0, 80),
+        path: cssPath(element),
+        inForm: !!element.closest('form'),
+        visible: rect.width > 0 && rect.height > 0
+    };
+});
+return {images: images, clickables: clickables};
+"""
+CLICK_SCRIPT = """
+var element = document.querySelector(arguments[0]);
+if (!element || element.tagName.toLowerCase() !== arguments[1]) return false;
+if ((element.innerText || element.value || '').trim().slice(0, 80) !== arguments[2]) return false;
+element.scrollIntoView({block: 'center'});
+element.click();
+return true;
+"""
+CHROMEDRIVER_PATH = os.environ.get(
+    'CHROMEDRIVER_PATH', 'C:/Users/User/Downloads/Programs/chromedriver-win64/chromedriver.exe'
+)
+DRIVER_POOL_SIZE = 2
+DRIVER_RECYCLE_AFTER = 200
+DRIVER_MAX_MEMORY_MB = 1500
+DRIVER_MEMORY_CHECK_EVERY = 10
+NETWORK_BUFFER_BYTES = 200 * 1024 * 1024
+NETWORK_IMAGE_MIN_BYTES = 100
+NETWORK_IMAGE_MIN_SIDE = 2
+BLOCKED_RESOURCE_EXTENSIONS = [
+    'png', 'jpg', 'jpeg', 'gif', 'webp', 'avif', 'svg', 'ico', 'bmp',
+    'woff', 'woff2', 'ttf', 'otf', 'eot',
+    'mp4', 'webm', 'ogg', 'mp3', 'wav', 'm4a',
+]
+BLOCKED_IMAGE_ENDPOINTS = ['*/_next/image?*', '*/cdn-cgi/image/*', '*/_ipx/*', '*/image/upload/*']
+BLOCKED_RESOURCE_PATTERNS = [
+    *(f'*.{extension}{suffix}' for extension in BLOCKED_RESOURCE_EXTENSIONS for suffix in ('', '?*', '#*')),
+    *BLOCKED_IMAGE_ENDPOINTS,
+]
+CRAWL_WORKERS = 4
+HOST_MIN_INTERVAL = 0.5
+HOST_MAX_CONCURRENCY = 2
+HTTP_TIMEOUT = (5, 20)
+HTTP_POOL_SIZE = 16
+USER_AGENT = 'Mozilla/5.0 (compatible; AltWriter/1.0)'
+JS_RENDERED_URL_PATTERNS = []
+JS_TEXT_THRESHOLD = 200
+APP_ROOT_IDS = ('root', 'app', '__next', '__nuxt')
+DOWNLOAD_WORKERS = 8
+DOWNLOAD_HOST_INTERVAL = 0.0
+MAX_IMAGE_BYTES = 25 * 1024 * 1024
+IMAGE_CACHE_DIR = '.image_cache'
+IMAGE_CACHE_MAX_BYTES = 2 * 1024 ** 3
+CRAWL_STATE_PATH = 'crawl_state.sqlite'
+SITEMAP_MAX_DEPTH = 3
+URL_ALLOW_PARAMS = None
+URL_DENY_PARAMS = ('utm_*', 'fbclid', 'gclid', 'dclid', 'msclkid', 'mc_cid', 'mc_eid', '_ga', '_gl', 'sessionid',
+                   'phpsessid', 'jsessionid')
+URL_LOWERCASE_PATH = False
+SEEN_SET_MAX_LOAD = 0.6
+CANONICAL_SCRIPT = ("const link = document.querySelector('link[rel~=\"canonical\"][href]'); "
+                    "return link ? link.href : null;")
+PIPELINE_WORKDIR = '.pipeline'
+PIPELINE_QUEUE_SIZE = 100
+PIPELINE_ALT_BATCH = 25
+PIPELINE_CACHE_FRESH_FOR = 7 * 24 * 3600
+BATCH_DIR = 'batch'
+BATCH_MAX_SITES = 4
+STAGE_DONE = object()
+METRICS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+METRICS_TRACE_MAX_URLS = 10000
+NULL_TIMER = nullcontext()
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+class StageTimer:
+    def __init__(self, metrics, stage, url):
+        self.metrics = metrics
+        self.stage = stage
+        self.url = url
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.stage, time.perf_counter() - self.started, self.url, self.started,
+                             failed=exc_type is not None)
+        return False
+
+
+class Metrics:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.started = time.perf_counter()
+        self.counters = {}
+        self.histograms = {}
+        self.traces = {}
+
+    def enable(self):
+        self.reset()
+        self.enabled = True
+
+    def count(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def timer(self, stage, url=None):
+        if not self.enabled:
+            return NULL_TIMER
+        return StageTimer(self, stage, url)
+
+    def observe(self, stage, seconds, url=None, started=None, failed=False):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = {'buckets': [0] * (len(METRICS_BUCKETS) + 1), 'count': 0, 'sum': 0.0, 'max': 0.0,
+                             'errors': 0}
+                self.histograms[stage] = histogram
+            index = next((i for i, bound in enumerate(METRICS_BUCKETS) if seconds <= bound), len(METRICS_BUCKETS))
+            histogram['buckets'][index] += 1
+            histogram['count'] += 1
+            histogram['sum'] += seconds
+            histogram['max'] = max(histogram['max'], seconds)
+            histogram['errors'] += failed
+
+            if url is None:
+                return
+            trace = self.traces.get(url)
+            if trace is None:
+                if len(self.traces) >= METRICS_TRACE_MAX_URLS:
+                    return
+                trace = self.traces[url] = []
+            started = self.started if started is None else started
+            trace.append({'stage': stage, 'start': round(started - self.started, 3), 'seconds': round(seconds, 3),
+                          'failed': failed})
+
+    def quantile(self, stage, fraction):
+        histogram = self.histograms[stage]
+        target = fraction * histogram['count']
+        seen = 0
+        for bound, bucket in zip(METRICS_BUCKETS, histogram['buckets']):
+            seen += bucket
+            if seen >= target:
+                return min(bound, histogram['max'])
+        return histogram['max']
+
+    def to_dict(self):
+        with self._lock:
+            histograms = {}
+            for stage, histogram in self.histograms.items():
+                cumulative = 0
+                buckets = {}
+                for bound, bucket in zip([*METRICS_BUCKETS, '+Inf'], histogram['buckets']):
+                    cumulative += bucket
+                    buckets[str(bound)] = cumulative
+                histograms[stage] = {**histogram, 'buckets': buckets}
+            return {
+                'elapsed': round(time.perf_counter() - self.started, 3),
+                'counters': dict(self.counters),
+                'histograms': histograms,
+                'traces': {url: list(trace) for url, trace in self.traces.items()},
+            }
+
+    def to_prometheus(self):
+        data = self.to_dict()
+        lines = [
+            '# TYPE altwriter_stage_seconds histogram',
+        ]
+        for stage, histogram in sorted(data['histograms'].items()):
+            for bound, cumulative in histogram['buckets'].items():
+                lines.append(f'altwriter_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'altwriter_stage_seconds_sum{{stage="{stage}"}} {histogram["sum"]:.6f}')
+            lines.append(f'altwriter_stage_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+        lines.append('# TYPE altwriter_stage_errors_total counter')
+        for stage, histogram in sorted(data['histograms'].items()):
+            lines.append(f'altwriter_stage_errors_total{{stage="{stage}"}} {histogram["errors"]}')
+        for name, value in sorted(data['counters'].items()):
+            metric = 'altwriter_' + re.sub(r'[^a-zA-Z0-9_]', '_', name) + '_total'
+            lines.append(f'# TYPE {metric} counter')
+            lines.append(f'{metric} {value}')
+        lines.append('# TYPE altwriter_elapsed_seconds gauge')
+        lines.append(f'altwriter_elapsed_seconds {data["elapsed"]}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        if path.endswith(('.prom', '.txt')):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.to_dict(), indent=2)
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+        logging.info(f'Wrote metrics to {path}')
+
+    def log_summary(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            stages = sorted(self.histograms.items(), key=lambda item: item[1]['sum'], reverse=True)
+            counters = dict(self.counters)
+            slowest = sorted(self.traces.items(), key=lambda item: sum(step['seconds'] for step in item[1]),
+                             reverse=True)[:5]
+        logging.info(f'Run metrics after {time.perf_counter() - self.started:.1f}s:')
+        for stage, histogram in stages:
+            mean = histogram['sum'] / histogram['count']
+            logging.info(f'  {stage}: {histogram["count"]} calls, {histogram["sum"]:.1f}s total, mean={mean:.3f}s '
+                         f'p50<={self.quantile(stage, 0.5):.3f}s p95<={self.quantile(stage, 0.95):.3f}s '
+                         f'max={histogram["max"]:.3f}s, {histogram["errors"]} errors')
+        if counters:
+            logging.info('  ' + ', '.join(f'{name}={value}' for name, value in sorted(counters.items())))
+        for url, trace in slowest:
+            stages_by_time = ', '.join(f'{step["stage"]}={step["seconds"]:.2f}s' for step in trace)
+            logging.info(f'  slow url {url}: {stages_by_time}')
+
+
+METRICS = Metrics()
 
 
 def is_image_url(url):
-    image_extensions = ('.jpeg', '.jpg', '.png', '.gif', '.bmp', '.tiff', '.svg', '.pdf')
-    return url.endswith(image_extensions)
+    if not url:
+        return False
+    image_extensions = ('.jpeg', '.jpg', '.png', '.gif', '.bmp', '.tiff', '.svg', '.pdf', '.webp', '.avif')
+    return urlsplit(url).path.lower().endswith(image_extensions)
 
 
-def ask_chatgpt(prompt):
+def keep_query_param(name, allow_params=URL_ALLOW_PARAMS, deny_params=URL_DENY_PARAMS):
+    name = name.lower()
+    if allow_params is not None and name not in allow_params:
+        return False
+    return not any(fnmatchcase(name, pattern) for pattern in deny_params)
+
+
+def canonicalize_url(url, allow_params=URL_ALLOW_PARAMS, deny_params=URL_DENY_PARAMS,
+                     lowercase_path=URL_LOWERCASE_PATH):
+    parts = urlsplit(url.strip())
+    host = parts.hostname or ''
+    if host.startswith('www.'):
+        host = host[4:]
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port is not None and (parts.scheme.lower(), port) not in (('http', 80), ('https', 443)):
+        host = f'{host}:{port}'
+    path = re.sub(r'/{2,}', '/', parts.path)
+    if lowercase_path:
+        path = path.lower()
+    path = path.rstrip('/') or '/'
+    params = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+              if keep_query_param(name, allow_params, deny_params)]
+    return urlunsplit(('', host, path, urlencode(sorted(params)), ''))
+
+
+def same_site(netloc, domain):
+    return netloc.lower().removeprefix('www.') == domain.lower().removeprefix('www.')
+
+
+class SeenSet:
+    def __init__(self, capacity=1024):
+        size = 16
+        while size * SEEN_SET_MAX_LOAD < capacity:
+            size *= 2
+        self._slots = array('Q', [0]) * size
+        self._mask = size - 1
+        self._count = 0
+
+    @staticmethod
+    def _hash(key):
+        value = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+        return value or 1
+
+    def _index(self, value):
+        index = value & self._mask
+        while self._slots[index] and self._slots[index] != value:
+            index = (index + 1) & self._mask
+        return index
+
+    def _grow(self):
+        old_slots = self._slots
+        self._slots = array('Q', [0]) * (len(old_slots) * 2)
+        self._mask = len(self._slots) - 1
+        for value in old_slots:
+            if value:
+                self._slots[self._index(value)] = value
+
+    def add(self, key):
+        value = self._hash(key)
+        index = self._index(value)
+        if self._slots[index]:
+            return False
+        self._slots[index] = value
+        self._count += 1
+        if self._count > len(self._slots) * SEEN_SET_MAX_LOAD:
+            self._grow()
+        return True
+
+    def __contains__(self, key):
+        return bool(self._slots[self._index(self._hash(key))])
+
+    def __len__(self):
+        return self._count
+
+
+def ask_chatgpt(prompt, session=None, api_url=None, max_tokens=CHATGPT_MAX_TOKENS, timeout=120):
     logging.info('Sending prompt')
-    chatgpt_api_url = "https://api.openai.com/v1/chat/completions"
+    chatgpt_api_url = api_url or CHATGPT_API_URL
     headers = {"Content-Type": "application/json", "Authorization": f"Bearer {CHATGPT_API_KEY}"}
     data = {
-        "model": "gpt-4o",
+        "model": CHATGPT_MODEL,
         "messages": [{"role": "user", "content": prompt}],
-        "max_tokens": 2000,
-        "temperature": 0.7
+        "max_tokens": max_tokens,
+        "temperature": CHATGPT_TEMPERATURE
     }
     logging.debug(f"Sending prompt to OpenAI: {prompt}")
-    response = requests.post(chatgpt_api_url, headers=headers, json=data)
-    response.raise_for_status()
-    logging.debug(f"Response from OpenAI: {response.json()}")
-    return response.json()
+    with METRICS.timer('chatgpt.request'):
+        response = (session or requests).post(chatgpt_api_url, headers=headers, json=data, timeout=timeout)
+        response.raise_for_status()
+    result = response.json()
+    logging.debug(f"Response from OpenAI: {result}")
+    usage = result.get('usage') or {}
+    METRICS.count('chatgpt.requests')
+    METRICS.count('chatgpt.prompt_tokens', usage.get('prompt_tokens', 0))
+    METRICS.count('chatgpt.completion_tokens', usage.get('completion_tokens', 0))
+    return result
 
 
-def driver_start():
+def driver_start(capture_network=False):
     options = Options()
     options.add_argument('--headless')
     options.add_argument('--disable-gpu')
     options.add_argument('--no-sandbox')
     options.add_argument('--disable-dev-shm-usage')
-    chrome_driver_path = "C:/Users/User/Downloads/Programs/chromedriver-win64/chromedriver.exe"
-    service = Service(executable_path=chrome_driver_path)
+    if capture_network:
+        options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+        options.add_experimental_option('perfLoggingPrefs', {'enableNetwork': True, 'enablePage': False})
+    if CHROMEDRIVER_PATH and os.path.exists(CHROMEDRIVER_PATH):
+        service = Service(executable_path=CHROMEDRIVER_PATH)
+    else:
+        service = Service()
     driver = webdriver.Chrome(service=service, options=options)
     return driver
 
 
+def set_resource_blocking(driver, block):
+    if block:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_RESOURCE_PATTERNS})
+    else:
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': []})
+
+
+class DriverPool:
+    def __init__(self, size=DRIVER_POOL_SIZE, recycle_after=DRIVER_RECYCLE_AFTER,
+                 max_memory_mb=DRIVER_MAX_MEMORY_MB, block_resources=False, capture_network=False):
+        self.size = size
+        self.recycle_after = recycle_after
+        self.max_memory_mb = max_memory_mb
+        self.block_resources = block_resources
+        self.capture_network = capture_network
+        self.stats = {'started': 0, 'recycled': 0, 'replaced': 0, 'retried': 0}
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._uses = {}
+        self._blocking = {}
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _start(self):
+        driver = driver_start(self.capture_network)
+        with self._lock:
+            self.stats['started'] += 1
+            self._uses[id(driver)] = 0
+            self._blocking[id(driver)] = False
+        METRICS.count('browser.started')
+        logging.info(f'Started browser session {self.stats["started"]}')
+        return driver
+
+    def _discard(self, driver):
+        with self._lock:
+            self._uses.pop(id(driver), None)
+            self._blocking.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception as e:
+            logging.debug(f'Error quitting browser session: {e}')
+
+    def is_healthy(self, driver):
+        try:
+            driver.execute_script('return 1')
+            return True
+        except Exception:
+            return False
+
+    def memory_mb(self, driver):
+        try:
+            if psutil is not None:
+                process = psutil.Process(driver.service.process.pid)
+                return sum(child.memory_info().rss for child in process.children(recursive=True)) / 1048576
+            used = driver.execute_script('return performance.memory ? performance.memory.usedJSHeapSize : 0')
+            return (used or 0) / 1048576
+        except Exception:
+            return 0
+
+    def acquire(self, block_resources=None):
+        block = self.block_resources if block_resources is None else block_resources
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    driver = self._idle.get_nowait()
+                except queue.Empty:
+                    driver = self._start()
+                    break
+                if self.is_healthy(driver):
+                    break
+                logging.warning('Replacing dead browser session')
+                self.stats['replaced'] += 1
+                self._discard(driver)
+            if self._blocking.get(id(driver)) != block:
+                set_resource_blocking(driver, block)
+                self._blocking[id(driver)] = block
+            return driver
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, driver):
+        try:
+            with self._lock:
+                uses = self._uses.get(id(driver), 0) + 1
+                self._uses[id(driver)] = uses
+            if self._closed or not self.is_healthy(driver):
+                self._discard(driver)
+            elif uses >= self.recycle_after:
+                logging.info(f'Recycling browser session after {uses} pages')
+                self.stats['recycled'] += 1
+                self._discard(driver)
+            elif uses % DRIVER_MEMORY_CHECK_EVERY == 0 and self.memory_mb(driver) > self.max_memory_mb:
+                logging.info(f'Recycling browser session above {self.max_memory_mb}MB')
+                self.stats['recycled'] += 1
+                self._discard(driver)
+            else:
+                self._idle.put(driver)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def driver(self, block_resources=None):
+        driver = self.acquire(block_resources)
+        try:
+            yield driver
+        finally:
+            self.release(driver)
+
+    def run(self, task, block_resources=None, attempts=2):
+        for attempt in range(attempts):
+            driver = self.acquire(block_resources)
+            try:
+                return task(driver)
+            except Exception:
+                if attempt == attempts - 1 or self.is_healthy(driver):
+                    raise
+                logging.warning('Browser session died mid-task, retrying on a fresh session')
+                self.stats['retried'] += 1
+                METRICS.count('browser.retries')
+            finally:
+                self.release(driver)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        logging.info(f'Browser pool closed: {self.stats["started"]} sessions started, '
+                     f'{self.stats["recycled"]} recycled, {self.stats["replaced"]} replaced, '
+                     f'{self.stats["retried"]} tasks retried')
+
+
 def get_links(url):
     web_driver = driver_start()
     domain = urlparse(url).netloc
@@ -114,120 +762,1059 @@ def get_links(url):
     return list(internal_links)
 
 
-def get_links2(url):
-    web_driver = driver_start()
+def fetch_url(web_driver, current_url, max_retries=5, delay=5):
+    retries = 0
+    while retries < max_retries:
+        try:
+            web_driver.get(current_url)
+            logging.debug(f'Got URL {current_url}')
+            return True
+        except Exception as e:
+            logging.warning(f'Error while fetching url: {current_url}\nException: {e}')
+            retries += 1
+            if retries < max_retries:
+                logging.info(f'Retrying to fetch url: {current_url}')
+                time.sleep(delay)
+            else:
+                logging.error(f'Failed to fetch URL: {current_url}')
+    return False
+
+
+def extract_links(web_driver, current_url, domain):
+    found = []
+    links = WebDriverWait(web_driver, 10).until(
+        EC.presence_of_all_elements_located((By.TAG_NAME, 'a'))
+    )
+    logging.debug(f"Found Links for {current_url}")
+    for link in links:
+        next_url = normalize_link(current_url, link.get_attribute('href'), domain)
+        if next_url:
+            found.append(next_url)
+    return found
+
+
+def normalize_link(current_url, href, domain):
+    if href and not is_image_url(href):
+        next_url = urljoin(current_url, href)
+        next_url = urlparse(next_url)._replace(fragment='').geturl()
+        if same_site(urlparse(next_url).netloc, domain):
+            return next_url
+    return None
+
+
+def crawl_page(web_driver, current_url, domain, limiter=None):
+    if limiter is not None:
+        with limiter.slot(current_url):
+            fetched = fetch_url(web_driver, current_url)
+    else:
+        fetched = fetch_url(web_driver, current_url)
+    if not fetched:
+        return []
+    return extract_links(web_driver, current_url, domain)
+
+
+def page_canonical(web_driver):
+    try:
+        return web_driver.execute_script(CANONICAL_SCRIPT)
+    except Exception as e:
+        logging.debug(f'Could not read rel=canonical: {e}')
+        return None
+
+
+def crawl_page_with_canonical(web_driver, current_url, domain, limiter=None):
+    links = crawl_page(web_driver, current_url, domain, limiter)
+    return links, page_canonical(web_driver)
+
+
+class LinkTracker:
+    def __init__(self, seeds=None, canonicalize=canonicalize_url):
+        self.canonicalize = canonicalize
+        self.links = []
+        self.seen = SeenSet()
+        self.crawled = SeenSet()
+        self.duplicates = SeenSet()
+        self._lock = threading.Lock()
+        self.seeds = [seed for seed in seeds or [] if self.add(seed)]
+
+    def add(self, url):
+        key = self.canonicalize(url)
+        with self._lock:
+            if not self.seen.add(key):
+                return False
+            self.links.append(url)
+            return True
+
+    def claim(self, url):
+        key = self.canonicalize(url)
+        with self._lock:
+            return self.crawled.add(key)
+
+    def resolve_canonical(self, url, canonical):
+        if not canonical:
+            return False
+        key = self.canonicalize(url)
+        canonical_key = self.canonicalize(canonical)
+        if canonical_key == key:
+            return False
+        with self._lock:
+            self.crawled.add(canonical_key)
+            if self.seen.add(canonical_key):
+                return False
+            self.duplicates.add(key)
+        logging.info(f'{url} is a duplicate of {canonical}')
+        return True
+
+    def unique_links(self):
+        with self._lock:
+            if not self.duplicates:
+                return list(self.links)
+            return [link for link in self.links if self.canonicalize(link) not in self.duplicates]
+
+
+def get_links2(url, pool=None, seeds=None, canonicalize=canonicalize_url):
+    own_pool = pool is None
+    pool = pool or DriverPool(size=1, block_resources=True)
     domain = urlparse(url).netloc
-    stack = [url]
-    internal_links = set()
-    crawled = set()
-    max_retries = 5
-    delay = 5
+    tracker = LinkTracker(seeds, canonicalize)
+    stack = [*reversed(tracker.seeds), url]
 
     try:
         while stack:
-            retries = 0
             current_url = stack.pop()
-
-            if current_url in crawled:
+            if not tracker.claim(current_url):
                 continue
 
-            while retries < max_retries:
-                try:
-                    web_driver.get(current_url)
-                    logging.debug(f'Got URL {current_url}')
+            try:
+                with METRICS.timer('crawl.page', current_url):
+                    next_urls, canonical = pool.run(
+                        lambda web_driver: crawl_page_with_canonical(web_driver, current_url, domain),
+                        block_resources=True
+                    )
+                METRICS.count('pages_crawled')
+                tracker.resolve_canonical(current_url, canonical)
+                for next_url in next_urls:
+                    if tracker.add(next_url):
+                        stack.append(next_url)
+            except Exception as e:
+                logging.error(f'Exception while fetching links for url: {current_url}\nException: {e}')
+    finally:
+        if own_pool:
+            pool.close()
+
+    internal_links = tracker.unique_links()
+    logging.info(f'Crawled {len(tracker.crawled)} pages, found {len(internal_links)} unique links, '
+                 f'{len(tracker.duplicates)} duplicates by rel=canonical')
+    return internal_links
+
+
+class HostLimiter:
+    def __init__(self, min_interval=HOST_MIN_INTERVAL, max_concurrency=HOST_MAX_CONCURRENCY):
+        self.min_interval = min_interval
+        self.max_concurrency = max_concurrency
+        self._lock = threading.Lock()
+        self._next_slot = {}
+        self._semaphores = {}
+
+    def _semaphore(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_concurrency)
+            return self._semaphores[host]
+
+    def penalize(self, url, seconds):
+        host = urlparse(url).netloc
+        with self._lock:
+            self._next_slot[host] = max(self._next_slot.get(host, 0), time.monotonic() + seconds)
+        logging.warning(f'Backing off {host} for {seconds}s')
+
+    @contextmanager
+    def slot(self, url):
+        host = urlparse(url).netloc
+        with self._semaphore(host):
+            with self._lock:
+                now = time.monotonic()
+                start = max(now, self._next_slot.get(host, now))
+                self._next_slot[host] = start + self.min_interval
+            if start > now:
+                time.sleep(start - now)
+            yield
+
+
+def wait_for_frontier(frontier, threads):
+    with frontier.all_tasks_done:
+        while frontier.unfinished_tasks:
+            if not any(thread.is_alive() for thread in threads):
+                logging.error('All crawl workers exited with work still queued')
+                return False
+            frontier.all_tasks_done.wait(1)
+    return True
+
+
+def get_links_parallel(url, workers=CRAWL_WORKERS, limiter=None, pool=None, seeds=None,
+                       canonicalize=canonicalize_url):
+    domain = urlparse(url).netloc
+    limiter = limiter or HostLimiter()
+    own_pool = pool is None
+    pool = pool or DriverPool(size=workers, block_resources=True)
+    frontier = queue.Queue()
+    tracker = LinkTracker(seeds, canonicalize)
+
+    def worker():
+        while True:
+            current_url = frontier.get()
+            try:
+                if current_url is None:
                     break
+                if not tracker.claim(current_url):
+                    continue
+
+                try:
+                    links, canonical = pool.run(
+                        lambda web_driver: crawl_page_with_canonical(web_driver, current_url, domain, limiter),
+                        block_resources=True
+                    )
                 except Exception as e:
-                    print(f'Error while fetching url: {current_url}\n Exception: {e}')
-                    retries += 1
-                    if retries < max_retries:
-                        print(f'Retrying to fetch url: {current_url}')
-                        time.sleep(delay)
-                    else:
-                        print(f'Failed to fetch URL: {current_url}')
+                    logging.error(f'Exception while fetching links for url: {current_url}\nException: {e}')
+                    continue
+
+                tracker.resolve_canonical(current_url, canonical)
+                for next_url in links:
+                    if tracker.add(next_url):
+                        frontier.put(next_url)
+            finally:
+                frontier.task_done()
+
+    for next_url in [url, *tracker.seeds]:
+        frontier.put(next_url)
+    threads = [threading.Thread(target=worker, name=f'crawl-{i}', daemon=True) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    wait_for_frontier(frontier, threads)
+    for _ in threads:
+        frontier.put(None)
+    for thread in threads:
+        thread.join()
+    if own_pool:
+        pool.close()
+
+    internal_links = tracker.unique_links()
+    logging.info(f'Parallel crawl of {url} found {len(internal_links)} links with {workers} workers, '
+                 f'{len(tracker.duplicates)} duplicates by rel=canonical')
+    return internal_links
+
+
+def make_session(pool_size=HTTP_POOL_SIZE, retries=3, backoff=0.5):
+    session = requests.Session()
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=('GET', 'HEAD'),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = USER_AGENT
+    return session
+
+
+def get_session():
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            _http_session = make_session()
+        return _http_session
+
+
+class LinkParser(HTMLParser):
+    def __init__(self, base_url):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.links = []
+        self.images = []
+        self.script_count = 0
+        self.text_length = 0
+        self.app_root = False
+        self.canonical = None
+        self._skip_tag = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if attrs.get('id') in APP_ROOT_IDS or 'data-reactroot' in attrs or 'ng-app' in attrs:
+            self.app_root = True
+        if tag == 'base' and attrs.get('href'):
+            self.base_url = urljoin(self.base_url, attrs['href'])
+        elif tag == 'a' and attrs.get('href'):
+            self.links.append(urljoin(self.base_url, attrs['href']))
+        elif tag == 'link' and 'canonical' in (attrs.get('rel') or '').lower().split() and attrs.get('href'):
+            self.canonical = urljoin(self.base_url, attrs['href'])
+        elif tag in ('img', 'source'):
+            alt = attrs.get('alt') or 'No Alt'
+            for source in (attrs.get('src'), attrs.get('data-src')):
+                if source:
+                    self.images.append((urljoin(self.base_url, source), alt))
+            for candidate in (attrs.get('srcset') or '').split(','):
+                candidate = candidate.strip().split(' ')[0]
+                if candidate:
+                    self.images.append((urljoin(self.base_url, candidate), alt))
+        elif tag in ('script', 'style', 'noscript'):
+            if tag == 'script':
+                self.script_count += 1
+            self._skip_tag = tag
+
+    def handle_endtag(self, tag):
+        if tag == self._skip_tag:
+            self._skip_tag = None
+
+    def handle_data(self, data):
+        if not self._skip_tag:
+            self.text_length += len(data.strip())
+
+
+def fetch_html(session, url):
+    with session.get(url, stream=True, timeout=HTTP_TIMEOUT) as response:
+        response.raise_for_status()
+        content_type = response.headers.get('Content-Type', '')
+        if 'html' not in content_type:
+            logging.debug(f'Skipping non-HTML response for {url}: {content_type}')
+            return None
+        if 'charset' not in content_type:
+            response.encoding = 'utf-8'
+        parser = LinkParser(response.url)
+        for chunk in response.iter_content(chunk_size=65536, decode_unicode=True):
+            parser.feed(chunk)
+        parser.close()
+        return parser
+
+
+def looks_js_rendered(url, parser, js_url_patterns=None):
+    for pattern in js_url_patterns or JS_RENDERED_URL_PATTERNS:
+        if re.search(pattern, url):
+            return True
+    if not parser.links and parser.script_count:
+        return True
+    return parser.app_root and parser.text_length < JS_TEXT_THRESHOLD
+
+
+def crawl_http(url, js_url_patterns=None, fallback=True, session=None, limiter=None, pool=None, seeds=None,
+               canonicalize=canonicalize_url):
+    session = session or make_session()
+    own_pool = pool is None
+    pool = pool or DriverPool(size=1, block_resources=True)
+    limiter = limiter or HostLimiter()
+    domain = urlparse(url).netloc
+    tracker = LinkTracker(seeds, canonicalize)
+    stack = [*reversed(tracker.seeds), url]
+    images = []
+    seen_images = set()
+    rendered = 0
 
-            crawled.add(current_url)
+    try:
+        while stack:
+            current_url = stack.pop()
+            if not tracker.claim(current_url):
+                continue
 
             try:
-                links = WebDriverWait(web_driver, 10).until(
-                    EC.presence_of_all_elements_located((By.TAG_NAME, 'a'))
-                )
-                logging.debug(f"Found Links for {current_url}")
-                for link in links:
-                    href = link.get_attribute('href')
-                    if href and not is_image_url(href):
-                        next_url = urljoin(current_url, href)
-                        next_url = urlparse(next_url)._replace(fragment='').geturl()
-                        if urlparse(next_url).netloc == domain and next_url not in internal_links:
-                            stack.append(next_url)
-                            internal_links.add(next_url)
-            except Exception as e:
-                print(f'Exception while fetching links for url: {current_url}\n Exception: {e}')
+                with limiter.slot(current_url):
+                    parser = fetch_html(session, current_url)
+            except requests.exceptions.RequestException as e:
+                logging.error(f'Error while fetching url over HTTP: {current_url}\nException: {e}')
+                continue
+            if parser is None:
+                continue
+
+            if fallback and looks_js_rendered(current_url, parser, js_url_patterns):
+                logging.info(f'Page looks JS-rendered, falling back to browser: {current_url}')
+                rendered += 1
+                try:
+                    next_urls, canonical = pool.run(
+                        lambda web_driver: crawl_page_with_canonical(web_driver, current_url, domain),
+                        block_resources=True
+                    )
+                except Exception as e:
+                    logging.error(f'Exception while fetching links for url: {current_url}\nException: {e}')
+                    next_urls, canonical = [], parser.canonical
+                tracker.resolve_canonical(current_url, canonical)
+            else:
+                tracker.resolve_canonical(current_url, parser.canonical)
+                next_urls = [normalize_link(current_url, href, domain) for href in parser.links]
+                for source, alt in parser.images:
+                    if source not in seen_images:
+                        seen_images.add(source)
+                        images.append((source, current_url, alt))
+
+            for next_url in next_urls:
+                if next_url and tracker.add(next_url):
+                    stack.append(next_url)
     finally:
-        web_driver.quit()
+        if own_pool:
+            pool.close()
 
-    return list(internal_links)
+    internal_links = tracker.unique_links()
+    logging.info(f'HTTP crawl of {url} found {len(internal_links)} links, {rendered} pages needed the browser, '
+                 f'{len(tracker.duplicates)} duplicates by rel=canonical')
+    return internal_links, images
 
 
-def scrape_images(urls):
-    img_data = []
-    processed_images = set()
-    driver = driver_start()
+def get_links_http(url, js_url_patterns=None, fallback=True, seeds=None):
+    links, _ = crawl_http(url, js_url_patterns=js_url_patterns, fallback=fallback, seeds=seeds)
+    return links
+
+
+def compare_link_modes(url, report_filename='link_comparison.xlsx', js_url_patterns=None, fallback=False, seeds=None):
+    browser_links = set(get_links2(url, seeds=seeds))
+    http_links = set(get_links_http(url, js_url_patterns=js_url_patterns, fallback=fallback, seeds=seeds))
+    rows = [(link, link in browser_links, link in http_links) for link in sorted(browser_links | http_links)]
+    comparison_df = pd.DataFrame(rows, columns=['Url', 'Browser', 'Http'])
+
+    both = len(browser_links & http_links)
+    logging.info(f'Links found by both modes: {both}, browser only: {len(browser_links - http_links)}, '
+                 f'HTTP only: {len(http_links - browser_links)}')
+    try:
+        comparison_df.to_excel(report_filename, index=False)
+        logging.info(f'Saved link comparison to {report_filename}')
+    except Exception as e:
+        logging.error(f'Error saving link comparison: {e}')
+    return comparison_df
+
+
+class CrawlState:
+    def __init__(self, path=CRAWL_STATE_PATH, canonicalize=canonicalize_url):
+        self.path = path
+        self.canonicalize = canonicalize
+        self._db = sqlite3.connect(path)
+        self._db.row_factory = sqlite3.Row
+        columns = {row['name'] for row in self._db.execute('PRAGMA table_info(pages)')}
+        if columns and 'key' not in columns:
+            logging.info(f'Crawl state {path} predates canonical URL keys, starting a fresh one')
+            self._db.executescript("""
+                DROP TABLE IF EXISTS meta;
+                DROP TABLE IF EXISTS frontier;
+                DROP TABLE IF EXISTS pages;
+                DROP TABLE IF EXISTS links;
+                DROP TABLE IF EXISTS images;
+            """)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS frontier (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                fetched_at REAL,
+                content_hash TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                crawl_run INTEGER,
+                scraped_hash TEXT,
+                canonical TEXT
+            );
+            CREATE TABLE IF NOT EXISTS links (
+                page TEXT NOT NULL,
+                link TEXT NOT NULL,
+                PRIMARY KEY (page, link)
+            );
+            CREATE TABLE IF NOT EXISTS images (
+                page TEXT NOT NULL,
+                src TEXT NOT NULL,
+                alt TEXT,
+                PRIMARY KEY (page, src)
+            );
+        """)
+        self.run_id = int(self._get_meta('run_id') or 0)
+
+    def _get_meta(self, key):
+        row = self._db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row['value'] if row else None
+
+    def _set_meta(self, key, value):
+        self._db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+    def key(self, url):
+        return self.canonicalize(url)
+
+    def _enqueue(self, urls):
+        rows = []
+        for url in urls:
+            key = self.key(url)
+            rows.append((key, url, key, self.run_id))
+        self._db.executemany(
+            'INSERT OR IGNORE INTO frontier (key, url) '
+            'SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM pages WHERE key = ? AND crawl_run = ?)',
+            rows
+        )
 
-    for url in urls:
+    def start_run(self, seed, seeds=()):
+        pending = self._db.execute('SELECT COUNT(*) FROM frontier').fetchone()[0]
+        if self._get_meta('run_status') == 'running' and pending:
+            logging.info(f'Resuming crawl run {self.run_id} with {pending} URLs in the frontier')
+            return False
+        self.run_id += 1
+        self._set_meta('run_id', self.run_id)
+        self._set_meta('run_status', 'running')
+        self._db.execute('DELETE FROM frontier')
+        self._enqueue([seed, *seeds])
+        self._db.commit()
+        logging.info(f'Starting crawl run {self.run_id} from {seed} with {len(seeds)} sitemap seeds')
+        return True
+
+    def finish_run(self):
+        self._set_meta('run_status', 'complete')
+        self._db.commit()
+
+    def next_url(self):
+        row = self._db.execute('SELECT url FROM frontier LIMIT 1').fetchone()
+        return row['url'] if row else None
+
+    def crawled_pages(self):
+        rows = self._db.execute('SELECT key FROM pages WHERE crawl_run = ?', (self.run_id,))
+        return {row['key'] for row in rows}
+
+    def discovered_links(self):
+        duplicates = {row['key'] for row in self._db.execute(
+            'SELECT key FROM pages WHERE crawl_run = ? AND canonical IS NOT NULL', (self.run_id,)
+        )}
+        rows = self._db.execute(
+            'SELECT url AS link FROM pages WHERE crawl_run = ? UNION ALL '
+            'SELECT links.link FROM links JOIN pages ON pages.key = links.page WHERE pages.crawl_run = ?',
+            (self.run_id, self.run_id)
+        )
+        links = {}
+        for row in rows:
+            key = self.key(row['link'])
+            if key not in duplicates:
+                links.setdefault(key, row['link'])
+        return list(links.values())
+
+    def page(self, url):
+        return self._db.execute('SELECT * FROM pages WHERE key = ?', (self.key(url),)).fetchone()
+
+    def page_links(self, url):
+        return [row['link'] for row in self._db.execute('SELECT link FROM links WHERE page = ?', (self.key(url),))]
+
+    def skip(self, url):
+        self._db.execute('DELETE FROM frontier WHERE key = ?', (self.key(url),))
+        self._db.commit()
+
+    def record_page(self, url, links, content_hash, etag, last_modified, fetched_at, canonical=None):
+        key = self.key(url)
+        self._db.execute(
+            'INSERT INTO pages (key, url, fetched_at, content_hash, etag, last_modified, crawl_run, canonical) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET url = excluded.url, fetched_at = excluded.fetched_at, '
+            'content_hash = excluded.content_hash, etag = excluded.etag, last_modified = excluded.last_modified, '
+            'crawl_run = excluded.crawl_run, canonical = excluded.canonical',
+            (key, url, fetched_at, content_hash, etag, last_modified, self.run_id, canonical)
+        )
+        self._db.execute('DELETE FROM links WHERE page = ?', (key,))
+        self._db.executemany('INSERT OR IGNORE INTO links (page, link) VALUES (?, ?)', [(key, link) for link in links])
+        self._enqueue([link for link in [*links, canonical] if link and self.key(link) != key])
+        self._db.execute('DELETE FROM frontier WHERE key = ?', (key,))
+        self._db.commit()
+
+    def pages_to_scrape(self):
+        rows = self._db.execute(
+            'SELECT url FROM pages WHERE crawl_run = ? AND canonical IS NULL '
+            'AND (scraped_hash IS NULL OR scraped_hash != content_hash)',
+            (self.run_id,)
+        )
+        return [row['url'] for row in rows]
+
+    def record_images(self, page, images):
+        key = self.key(page)
+        self._db.execute('DELETE FROM images WHERE page = ?', (key,))
+        self._db.executemany(
+            'INSERT OR IGNORE INTO images (page, src, alt) VALUES (?, ?, ?)',
+            [(key, source, alt) for source, _, alt in images]
+        )
+        self._db.execute('UPDATE pages SET scraped_hash = content_hash WHERE key = ?', (key,))
+        self._db.commit()
+
+    def current_images(self):
+        rows = self._db.execute(
+            'SELECT images.src, pages.url, images.alt FROM images JOIN pages ON pages.key = images.page '
+            'WHERE pages.crawl_run = ? AND pages.canonical IS NULL ORDER BY pages.url',
+            (self.run_id,)
+        )
+        img_data = []
+        seen = set()
+        for row in rows:
+            if row['src'] not in seen:
+                seen.add(row['src'])
+                img_data.append((row['src'], row['url'], row['alt']))
+        return img_data
 
+    def close(self):
+        self._db.close()
+
+
+def parse_lastmod(value):
+    try:
+        parsed = datetime.fromisoformat(value.strip())
+    except (AttributeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def robots_sitemaps(url, session=None):
+    session = session or get_session()
+    parts = urlparse(url)
+    robots_url = f'{parts.scheme}://{parts.netloc}/robots.txt'
+    sitemaps = []
+    try:
+        response = session.get(robots_url, timeout=HTTP_TIMEOUT)
+        if response.ok:
+            for line in response.text.splitlines():
+                name, _, value = line.partition(':')
+                if name.strip().lower() == 'sitemap' and value.strip():
+                    sitemaps.append(urljoin(robots_url, value.strip()))
+    except requests.exceptions.RequestException as e:
+        logging.error(f'Could not read {robots_url}: {e}')
+    logging.info(f'Found {len(sitemaps)} sitemaps in {robots_url}')
+    return sitemaps or [f'{parts.scheme}://{parts.netloc}/sitemap.xml']
+
+
+def open_sitemap_stream(response):
+    response.raw.decode_content = True
+    response.raw.auto_close = False
+    stream = BufferedReader(response.raw)
+    if stream.peek(2)[:2] == b'\x1f\x8b':
+        return gzip.GzipFile(fileobj=stream)
+    return stream
+
+
+def iter_sitemap(sitemap_url, session=None, max_depth=SITEMAP_MAX_DEPTH, visited=None):
+    session = session or get_session()
+    visited = set() if visited is None else visited
+    if sitemap_url in visited:
+        return
+    visited.add(sitemap_url)
+    children = []
+    count = 0
+    try:
+        with session.get(sitemap_url, stream=True, timeout=HTTP_TIMEOUT) as response:
+            response.raise_for_status()
+            root = None
+            loc = lastmod = None
+            for event, element in ElementTree.iterparse(open_sitemap_stream(response), events=('start', 'end')):
+                if root is None:
+                    root = element
+                if event == 'start':
+                    continue
+                tag = element.tag.rsplit('}', 1)[-1]
+                if tag == 'loc':
+                    loc = (element.text or '').strip()
+                elif tag == 'lastmod':
+                    lastmod = parse_lastmod(element.text)
+                elif tag in ('url', 'sitemap'):
+                    if loc and tag == 'url':
+                        count += 1
+                        yield loc, lastmod
+                    elif loc:
+                        children.append(loc)
+                    loc = lastmod = None
+                    root.clear()
+    except Exception as e:
+        logging.error(f'Could not read sitemap {sitemap_url}: {e}')
+    logging.info(f'Read {count} URLs and {len(children)} child sitemaps from {sitemap_url}')
+
+    if max_depth > 0:
+        for child in children:
+            yield from iter_sitemap(child, session, max_depth - 1, visited)
+
+
+def discover_urls(url, session=None, sitemap_urls=None, canonicalize=canonicalize_url, lastmods=None):
+    session = session or get_session()
+    domain = urlparse(url).netloc
+    seen = SeenSet()
+    urls = []
+    for sitemap_url in sitemap_urls or robots_sitemaps(url, session):
+        for loc, lastmod in iter_sitemap(sitemap_url, session):
+            if not normalize_link(url, loc, domain):
+                continue
+            key = canonicalize(loc)
+            if lastmods is not None and lastmod:
+                lastmods[key] = max(lastmod, lastmods.get(key, lastmod))
+            if seen.add(key):
+                urls.append(loc)
+    logging.info(f'Discovered {len(urls)} unique URLs from sitemaps for {url}')
+    return urls
+
+
+def check_not_modified(session, url, page):
+    headers = {}
+    if page is not None:
+        if page['etag']:
+            headers['If-None-Match'] = page['etag']
+        if page['last_modified']:
+            headers['If-Modified-Since'] = page['last_modified']
+    try:
+        response = session.head(url, headers=headers, timeout=HTTP_TIMEOUT, allow_redirects=True)
+    except requests.exceptions.RequestException as e:
+        logging.debug(f'Conditional request failed for {url}: {e}')
+        return False, None, None
+    not_modified = bool(headers) and response.status_code == 304
+    return not_modified, response.headers.get('ETag'), response.headers.get('Last-Modified')
+
+
+def page_content_hash(web_driver, links):
+    text = web_driver.execute_script('return document.body ? document.body.innerText : "";') or ''
+    digest = hashlib.sha256(text.encode('utf-8'))
+    for link in sorted(set(links)):
+        digest.update(link.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def crawl_page_with_hash(web_driver, current_url, domain):
+    if not fetch_url(web_driver, current_url):
+        raise RuntimeError(f'Could not load {current_url}')
+    try:
+        links = extract_links(web_driver, current_url, domain)
+    except TimeoutException:
+        links = []
+    canonical = normalize_link(current_url, page_canonical(web_driver), domain)
+    return links, page_content_hash(web_driver, links), canonical
+
+
+def get_links_incremental(url, state_path=CRAWL_STATE_PATH, sitemap_url=None, session=None, pool=None,
+                          on_page=None, canonicalize=canonicalize_url):
+    session = session or get_session()
+    own_pool = pool is None
+    pool = pool or DriverPool(size=1, block_resources=True)
+    state = CrawlState(state_path, canonicalize)
+    lastmods = {}
+    seeds = discover_urls(url, session, [sitemap_url] if sitemap_url else None, canonicalize, lastmods)
+    state.start_run(url, seeds)
+    domain = urlparse(url).netloc
+    crawled = state.crawled_pages()
+    reused = 0
+    changed = 0
+    duplicates = 0
+
+    try:
+        while True:
+            current_url = state.next_url()
+            if current_url is None:
+                break
+            key = state.key(current_url)
+            if key in crawled:
+                state.skip(current_url)
+                continue
+
+            previous = state.page(current_url)
+            fetched_at = time.time()
+            lastmod = lastmods.get(key)
+            if previous is not None and lastmod and previous['fetched_at'] and lastmod <= previous['fetched_at']:
+                not_modified, etag, last_modified = True, previous['etag'], previous['last_modified']
+            else:
+                not_modified, etag, last_modified = check_not_modified(session, current_url, previous)
+
+            if previous is not None and not_modified:
+                logging.info(f'Unchanged since last crawl, reusing links: {current_url}')
+                links = state.page_links(current_url)
+                content_hash = previous['content_hash']
+                canonical = previous['canonical']
+                etag = etag or previous['etag']
+                last_modified = last_modified or previous['last_modified']
+                reused += 1
+            else:
+                try:
+                    links, content_hash, canonical = pool.run(
+                        lambda web_driver: crawl_page_with_hash(web_driver, current_url, domain),
+                        block_resources=True
+                    )
+                except Exception as e:
+                    logging.error(f'Exception while fetching links for url: {current_url}\nException: {e}')
+                    crawled.add(key)
+                    if previous is None:
+                        state.skip(current_url)
+                        continue
+                    logging.info(f'Keeping links from the last crawl of {current_url} until it loads again')
+                    links = state.page_links(current_url)
+                    content_hash = previous['content_hash']
+                    canonical = previous['canonical']
+                    etag, last_modified = previous['etag'], previous['last_modified']
+                    fetched_at = previous['fetched_at']
+                else:
+                    if previous is None or previous['content_hash'] != content_hash:
+                        changed += 1
+
+            if canonical and state.key(canonical) == key:
+                canonical = None
+            state.record_page(current_url, links, content_hash, etag, last_modified, fetched_at, canonical)
+            crawled.add(key)
+            if canonical:
+                logging.info(f'{current_url} is a duplicate of {canonical}')
+                duplicates += 1
+            elif on_page is not None:
+                on_page(current_url)
+        state.finish_run()
+        internal_links = state.discovered_links()
+    finally:
+        if own_pool:
+            pool.close()
+        state.close()
+
+    logging.info(f'Incremental crawl of {url}: {len(internal_links)} links, {reused} pages reused, '
+                 f'{changed} pages new or changed, {duplicates} duplicates by rel=canonical')
+    return internal_links
+
+
+def scrape_images_incremental(state_path=CRAWL_STATE_PATH, pool=None):
+    state = CrawlState(state_path)
+    try:
+        pages = state.pages_to_scrape()
+        logging.info(f'Re-scraping images for {len(pages)} new or changed pages')
+        scrape_images(pages, on_page=state.record_images, pool=pool)
+        return state.current_images()
+    finally:
+        state.close()
+
+
+def start_network_capture(driver):
+    driver.execute_cdp_cmd('Network.enable', {'maxTotalBufferSize': NETWORK_BUFFER_BYTES,
+                                              'maxResourceBufferSize': MAX_IMAGE_BYTES})
+    driver.get_log('performance')
+
+
+def read_response_body(driver, request_id):
+    body = driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+    if body.get('base64Encoded'):
+        return base64.b64decode(body['body'])
+    return body['body'].encode('utf-8')
+
+
+def capture_network_images(driver, page_url, include_bodies=True):
+    try:
+        entries = driver.get_log('performance')
+    except Exception as e:
+        logging.error(f'Could not read network log for {page_url}: {e}')
+        return []
+
+    responses = {}
+    finished = {}
+    for entry in entries:
+        try:
+            message = json.loads(entry['message'])['message']
+        except (KeyError, TypeError, ValueError):
+            continue
+        method = message.get('method')
+        params = message.get('params', {})
+        if method == 'Network.responseReceived':
+            response = params.get('response', {})
+            mime_type = (response.get('mimeType') or '').lower()
+            if params.get('type') != 'Image' and not mime_type.startswith('image/'):
+                continue
+            if not response.get('url', '').startswith('http') or not 200 <= response.get('status', 0) < 300:
+                continue
+            responses[params['requestId']] = {
+                'src': response['url'],
+                'page': page_url,
+                'mime_type': mime_type,
+                'transfer_size': None,
+                'size': None,
+                'data': None,
+            }
+        elif method == 'Network.loadingFinished':
+            finished[params.get('requestId')] = params.get('encodedDataLength')
+
+    records = {}
+    for request_id, record in responses.items():
+        if request_id not in finished or record['src'] in records:
+            continue
+        record['transfer_size'] = finished[request_id]
+        if include_bodies:
+            try:
+                record['data'] = read_response_body(driver, request_id)
+                record['size'] = len(record['data'])
+            except Exception as e:
+                logging.debug(f'Could not read response body for {record["src"]}: {e}')
+        records[record['src']] = record
+    logging.info(f'Captured {len(records)} image responses from the network for {page_url}')
+    METRICS.count('network_images', len(records))
+    return list(records.values())
+
+
+def network_sources(images, url):
+    sources = {}
+    for image in images:
+        source = image_record_source(image)
+        if source and image.get('currentSrc'):
+            sources[image['currentSrc']] = urljoin(url, source)
+    return sources
+
+
+def is_tracking_image(record, domain):
+    parts = urlsplit(record['src'])
+    if not same_site(parts.netloc, domain) and parts.query and not is_image_url(record['src']):
+        return True
+    data = record['data']
+    if data is None or is_svg(data):
+        return False
+    try:
+        with PILImage.open(BytesIO(data)) as img:
+            return min(img.size) < NETWORK_IMAGE_MIN_SIDE
+    except Exception:
+        return len(data) < NETWORK_IMAGE_MIN_BYTES
+
+
+def add_network_images(driver, url, page_images, processed_images, on_image_bytes, sources=None):
+    sources = sources or {}
+    domain = urlparse(url).netloc
+    new_images = 0
+    skipped = 0
+    for record in capture_network_images(driver, url):
+        source = sources.get(record['src'], record['src'])
+        if record['src'] not in sources and is_tracking_image(record, domain):
+            skipped += 1
+            continue
+        if record['data'] is not None:
+            on_image_bytes(source, record['data'])
+        if record['src'] in sources or source in processed_images:
+            continue
+        page_images.append((source, url, 'No Alt'))
+        processed_images.add(source)
+        new_images += 1
+    if new_images:
+        logging.info(f'Network capture found {new_images} images not present as <img> tags on {url}')
+    if skipped:
+        logging.debug(f'Network capture skipped {skipped} tracking pixels and beacons on {url}')
+
+
+def scrape_page(driver, url, processed_images, interactions=None, on_image_bytes=None, rendered_sizes=None):
+    page_images = []
+    processed_images = set(processed_images)
+    if on_image_bytes is not None:
         try:
-            logging.info(f'Attempting to get URL: {url}')
+            start_network_capture(driver)
+        except Exception as e:
+            logging.error(f'Could not start network capture, is the pool started with capture_network? {e}')
+            on_image_bytes = None
+    try:
+        logging.info(f'Attempting to get URL: {url}')
+        with METRICS.timer('scrape.load', url):
             driver.get(url)
             WebDriverWait(driver, 60).until(
                 EC.presence_of_element_located((By.XPATH, '//body'))
             )
-            logging.info(f'Successfully got URL: {url}')
-        except Exception as e:
-            logging.error(f'Failed to get URL: {url}\nException: {e}')
-            continue
+        logging.info(f'Successfully got URL: {url}')
+    except Exception as e:
+        logging.error(f'Failed to get URL: {url}\nException: {e}')
+        return None
 
+    with METRICS.timer('scrape.settle', url):
         scroll_down(driver)
 
-        try:
-            logging.info(f'Attempting to get initial images for url: {url}')
-            initial_images = WebDriverWait(driver, 20).until(
-                EC.presence_of_all_elements_located((By.TAG_NAME, 'img'))
-            )
-            img_data.extend(process_image_data(initial_images, url, processed_images))
-            logging.info(f'Successfully scraped initial images: {len(initial_images)}')
-        except Exception as e:
-            logging.error(f'Could not process images: {e}')
+    with METRICS.timer('scrape.harvest', url):
+        harvest = harvest_page(driver)
+    try:
+        logging.info(f'Attempting to get initial images for url: {url}')
+        initial_images = harvest['images']
+        page_images.extend(process_image_data(initial_images, url, processed_images, rendered_sizes))
+        logging.info(f'Successfully scraped initial images: {len(initial_images)}')
+    except Exception as e:
+        logging.error(f'Could not process images: {e}')
 
-        try:
-            logging.info(f'Attempting to get clickable elements for url: {url}')
-            elements = get_clickable_elements(driver, url)
-            logging.info(f'Successfully got {len(elements)} clickable elements')
-        except Exception as e:
-            logging.error('Could not get clickable elements')
-            continue
+    if on_image_bytes is not None:
+        sources = network_sources(harvest['images'], url)
+        with METRICS.timer('scrape.network', url):
+            add_network_images(driver, url, page_images, processed_images, on_image_bytes, sources)
 
-        processed_elements = []
-        for attributes in elements:
-            process_element(driver, attributes, img_data, processed_elements, processed_images, url)
+    try:
+        logging.info(f'Attempting to get clickable elements for url: {url}')
+        elements = get_clickable_elements(driver, url, harvest)
+        logging.info(f'Successfully got {len(elements)} clickable elements')
+    except Exception as e:
+        logging.error('Could not get clickable elements')
+        elements = []
+
+    with METRICS.timer('scrape.explore', url):
+        explore_interactions(driver, url, elements, page_images, processed_images, interactions=interactions,
+                             rendered_sizes=rendered_sizes)
+    if on_image_bytes is not None:
+        sources.update(network_sources(harvest_page(driver)['images'], url))
+        with METRICS.timer('scrape.network', url):
+            add_network_images(driver, url, page_images, processed_images, on_image_bytes, sources)
+    return page_images, processed_images
+
+
+def scrape_images(urls, on_page=None, interactions=None, pool=None, on_image_bytes=None):
+    img_data = []
+    processed_images = set()
+    own_pool = pool is None
+    pool = pool or DriverPool(size=1, capture_network=on_image_bytes is not None)
+
+    try:
+        for url in urls:
+            try:
+                with METRICS.timer('scrape.page', url):
+                    result = pool.run(
+                        lambda driver: scrape_page(driver, url, processed_images, interactions, on_image_bytes),
+                        block_resources=False
+                    )
+            except Exception as e:
+                logging.error(f'Error scraping images from {url}: {e}')
+                continue
+            if result is None:
+                continue
+            page_images, processed_images = result
+            img_data.extend(page_images)
+            METRICS.count('pages_scraped')
+            METRICS.count('images_found', len(page_images))
+
+            if on_page is not None:
+                on_page(url, page_images)
+    finally:
+        if own_pool:
+            pool.close()
 
-    driver.quit()
     logging.info(f'Successfully scraped images: {len(img_data)}')
     return img_data
 
 
-def process_image_data(images, url, processed_images):
+def harvest_page(driver):
+    try:
+        harvest = driver.execute_script(HARVEST_SCRIPT, CLICKABLE_SELECTOR)
+        logging.debug(f'Harvested {len(harvest["images"])} images and {len(harvest["clickables"])} clickables')
+        return harvest
+    except Exception as e:
+        logging.error(f'Error harvesting page: {e}')
+        return {'images': [], 'clickables': []}
+
+
+def image_record_source(image):
+    source = image.get('src') or image.get('currentSrc')
+    if (not source or source.startswith('data:')) and image.get('dataSrc'):
+        source = image['dataSrc']
+    return source
+
+
+def process_image_data(images, url, processed_images, rendered_sizes=None):
     image_data = []
     for image in images:
         try:
-            source = image.get_attribute('src')
+            source = image_record_source(image)
             if source:
                 source = urljoin(url, source)
+                if rendered_sizes is not None and image.get('renderedWidth'):
+                    size = (image['renderedWidth'], image.get('renderedHeight') or 0)
+                    rendered_sizes[source] = max(size, rendered_sizes.get(source, size))
                 if source not in processed_images:
-                    alt = image.get_attribute('alt') or 'No Alt'
+                    alt = image.get('alt') or 'No Alt'
                     image_data.append((source, url, alt))
                     processed_images.add(source)
                 else:
-                    logging.warning(f'Duplicate source for image on URL: {url} - {source}')
+                    logging.debug(f'Duplicate source for image on URL: {url} - {source}')
             else:
                 logging.warning(f'No source for image on URL: {url}')
         except Exception as e:
@@ -235,117 +1822,154 @@ def process_image_data(images, url, processed_images):
     return image_data
 
 
-def scroll_down(driver):
+def wait_for_page_settle(driver, quiet_ms=SETTLE_QUIET_MS, timeout=SETTLE_TIMEOUT, scroll=True):
     try:
-        height = driver.execute_script("return document.body.scrollHeight")
-        while True:
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(5)
-            new_height = driver.execute_script("return document.body.scrollHeight")
-            if new_height == height:
-                logging.info('Reached the bottom of the page.')
-                break
-            height = new_height
+        driver.set_script_timeout(timeout + 5)
+        result = driver.execute_async_script(SETTLE_SCRIPT, quiet_ms, timeout * 1000, scroll)
+        if result['settled']:
+            logging.info(f'Page settled in {result["elapsed"]}ms')
+        else:
+            logging.warning(f'Page did not settle within {timeout}s: {result["pendingRequests"]} requests and '
+                            f'{result["pendingImages"]} images still pending')
+        return result
     except Exception as e:
-        logging.error(f'Error during scroll down: {e}')
+        logging.error(f'Error waiting for page to settle: {e}')
+        return None
+
+
+def scroll_down(driver):
+    wait_for_page_settle(driver, scroll=True)
+
+
+def element_fingerprint(clickable):
+    attributes = sorted((name, value) for name, value in clickable['attributes'].items()
+                        if name not in VOLATILE_ATTRIBUTES)
+    identity = [attributes, clickable['text']]
+    if not clickable['text'] and len(attributes) <= 1:
+        identity.append(clickable['path'])
+    return hashlib.sha1(json.dumps(identity).encode('utf-8')).hexdigest()
 
 
-def get_clickable_elements(driver, url):
+def is_navigating(clickable):
+    raw_href = (clickable['rawHref'] or '').strip().lower()
+    if raw_href and not raw_href.startswith(('#', 'javascript:')):
+        return True
+    element_type = (clickable['attributes'].get('type') or '').lower()
+    return clickable['inForm'] and clickable['attributes']['tag'] in ('button', 'input') and element_type != 'button'
+
+
+def get_clickable_elements(driver, url, harvest=None):
     elements = []
+    seen = set()
     try:
-        scroll_down(driver)
-        clickable_elements = driver.find_elements(By.CSS_SELECTOR, "*[onclick], button, [role='button'], a[href]")
-        elements = [get_element_attributes(driver, element) for element in clickable_elements if
-                    urlparse(element.get_attribute('href')).netloc == url or element.get_attribute('href') is None]
-        pointer_elements = driver.find_elements(By.CSS_SELECTOR, "[style='cursor: pointer']")
-        elements += [get_element_attributes(driver, element) for element in pointer_elements if (
-                urlparse(element.get_attribute('href')).netloc == url or element.get_attribute(
-            'href') is None) and element not in clickable_elements]
+        harvest = harvest or harvest_page(driver)
+        for clickable in harvest['clickables']:
+            if is_navigating(clickable) or not clickable['visible']:
+                continue
+            clickable['fingerprint'] = element_fingerprint(clickable)
+            if clickable['fingerprint'] not in seen:
+                seen.add(clickable['fingerprint'])
+                elements.append(clickable)
         logging.debug(f'Found {len(elements)} clickable elements.')
     except Exception as e:
         logging.error(f'Error getting clickable elements: {e}')
     return elements
 
 
-def get_element_attributes(driver, element):
-    attributes = driver.execute_script("""
-    function getElementAttributesAsDict(element) {
-        var attributesDict = {};
-        attributesDict["tag"] = element.tagName.toLowerCase();
-        Array.from(element.attributes).forEach(attr => {
-            attributesDict[attr.name] = attr.value;
-        });
-        return attributesDict;
-    }
-    return getElementAttributesAsDict(arguments[0]);
-    """, element)
-    return attributes
+def describe_element(clickable):
+    attributes = clickable['attributes']
+    description = attributes['tag']
+    if attributes.get('id'):
+        description += f"#{attributes['id']}"
+    if clickable['text']:
+        description += f" '{clickable['text'][:40]}'"
+    return description
 
 
-def find_element_by_attributes(driver, attributes):
-    selector = f"{attributes.get('tag', '')}"
-    for attr, value in attributes.items():
-        if attr != 'tag' and value:
-            selector += f"[{attr}='{value}']"
+def restore_page(driver, url):
+    try:
+        driver.back()
+        wait_for_page_settle(driver, quiet_ms=300, timeout=5, scroll=False)
+        if urlparse(driver.current_url)._replace(fragment='') == urlparse(url)._replace(fragment=''):
+            return
+    except Exception as e:
+        logging.warning(f'Could not navigate back to {url}: {e}')
+    logging.info(f'Reloading {url} to restore page state')
+    driver.get(url)
+    WebDriverWait(driver, 60).until(
+        EC.presence_of_element_located((By.TAG_NAME, 'body'))
+    )
+    wait_for_page_settle(driver)
+
+
+def process_element(driver, clickable, url, img_data, processed_images, interactions=None, rendered_sizes=None):
+    description = describe_element(clickable)
+    with METRICS.timer('explore.click', url):
+        try:
+            clicked = driver.execute_script(CLICK_SCRIPT, clickable['path'], clickable['attributes']['tag'],
+                                            clickable['text'])
+        except Exception as e:
+            logging.error(f'Error clicking element {description}: {e}')
+            return None
+        if not clicked:
+            logging.info(f'Element no longer present: {description}')
+            return None
+        logging.info(f'Clicked element {description}')
+        wait_for_page_settle(driver, quiet_ms=300, timeout=5, scroll=False)
+    METRICS.count('clicks')
+
+    new_url = driver.current_url
+    if urlparse(new_url)._replace(fragment='') != urlparse(url)._replace(fragment=''):
+        logging.info(f'Click navigated to {new_url}, restoring {url}')
+        restore_page(driver, url)
+        return None
+
+    with METRICS.timer('explore.harvest', url):
+        harvest = harvest_page(driver)
+    new_images = process_image_data(harvest['images'], url, processed_images, rendered_sizes)
+    img_data.extend(new_images)
+    METRICS.count('images_revealed', len(new_images))
+    if new_images:
+        logging.info(f'{description} revealed {len(new_images)} new images')
+    if interactions is not None:
+        interactions.append({
+            'page': url,
+            'fingerprint': clickable['fingerprint'],
+            'element': description,
+            'new_images': [image[0] for image in new_images],
+        })
 
     try:
-        web_element = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, selector))
-        )
-        return web_element
-    except TimeoutException as e:
-        logging.warning(f'Could not find element, timed out: {e}')
-    except StaleElementReferenceException as e:
-        logging.warning(f'Stale element reference: {e}')
+        driver.switch_to.active_element.send_keys(Keys.ESCAPE)
     except Exception as e:
-        logging.warning(f'Error while finding element by attributes: {e}')
+        logging.debug(f'Could not dismiss overlay after clicking {description}: {e}')
+    return harvest
 
-    logging.info('No Web Element found')
-    return None
 
+def explore_interactions(driver, url, elements, img_data, processed_images, max_clicks=EXPLORE_MAX_CLICKS,
+                         max_seconds=EXPLORE_MAX_SECONDS, interactions=None, rendered_sizes=None):
+    pending = deque(elements)
+    queued = {element['fingerprint'] for element in elements}
+    visited = set()
+    started = time.monotonic()
 
-def process_element(driver, attributes, img_data, elements, processed_images, url):
-    retry_count = 3
-    for _ in range(retry_count):
-        try:
-            element = find_element_by_attributes(driver, attributes)
-            if element:
-                logging.info('Scrolling elements into view')
-                driver.execute_script("arguments[0].scrollIntoView(true)", element)
-                WebDriverWait(driver, 10).until(
-                    EC.element_to_be_clickable(element)
-                )
-                logging.info('Successfully scrolled element into view')
-                time.sleep(1)
-                element.click()
-                logging.info('Clicked element')
-                WebDriverWait(driver, 10)
-                logging.info('111111')
-                new_url = driver.current_url
-                if new_url != url:
-                    logging.info(f'New url detected {new_url}')
-                    driver.get(url)
-                    WebDriverWait(driver, 60).until(
-                        EC.presence_of_element_located((By.TAG_NAME, 'body'))
-                    )
-                logging.info('Getting clickable elements')
-                new_elements = get_clickable_elements(driver, url)
-                for new_element in new_elements:
-                    new_frozenset_element = frozenset(new_element.items())
-                    if new_frozenset_element not in elements:
-                        elements.append(new_frozenset_element)
-                logging.info('Successfully got clickable elements')
-                logging.info('Getting new images')
-                new_images = WebDriverWait(driver, 10).until(
-                    EC.presence_of_all_elements_located((By.TAG_NAME, 'img'))
-                )
-                img_data.extend(process_image_data(new_images, url, processed_images))
-            break
-        except StaleElementReferenceException:
-            logging.warning(f'Stale element reference, retrying: {attributes}')
-        except Exception as e:
-            logging.error(f'Error processing element: {e}')
+    while pending:
+        if len(visited) >= max_clicks or time.monotonic() - started > max_seconds:
+            logging.info(f'Interaction budget reached on {url} with {len(pending)} elements left unexplored')
             break
+        clickable = pending.popleft()
+        visited.add(clickable['fingerprint'])
+
+        harvest = process_element(driver, clickable, url, img_data, processed_images, interactions, rendered_sizes)
+        if harvest is None:
+            continue
+        for new_element in get_clickable_elements(driver, url, harvest):
+            if new_element['fingerprint'] not in queued:
+                queued.add(new_element['fingerprint'])
+                pending.append(new_element)
+
+    logging.info(f'Explored {len(visited)} interactions on {url}')
+    return visited
 
 
 def resize_image(path):
@@ -364,7 +1988,476 @@ def resize_image(path):
         logging.error(f'Couldnt resize image with path: {path}')
 
 
-def write_to_excel(image_arr, excel_filename, sheet_name):
+def read_body(response, max_bytes=MAX_IMAGE_BYTES):
+    chunks = []
+    size = 0
+    for chunk in response.iter_content(chunk_size=65536):
+        size += len(chunk)
+        if size > max_bytes:
+            raise ValueError(f'Image larger than {max_bytes} bytes: {response.url}')
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def download_image(session, source, max_bytes=MAX_IMAGE_BYTES):
+    with session.get(source, stream=True, timeout=HTTP_TIMEOUT) as response:
+        response.raise_for_status()
+        return read_body(response, max_bytes)
+
+
+class ImageCache:
+    def __init__(self, directory=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES, fresh_for=0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fresh_for = fresh_for
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'deduplicated': 0, 'evicted': 0,
+                      'bytes_downloaded': 0, 'bytes_served': 0}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, 'index.sqlite'), check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                checked_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS blobs_last_access ON blobs (last_access);
+        """)
+        self._total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+
+    def _blob_path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _lookup(self, url):
+        with self._lock:
+            return self._db.execute(
+                'SELECT digest, etag, last_modified, checked_at FROM urls WHERE url = ?', (url,)
+            ).fetchone()
+
+    def _read_blob(self, url, digest, revalidated=False):
+        try:
+            with open(self._blob_path(digest), 'rb') as f:
+                data = f.read()
+        except OSError:
+            logging.warning(f'Cached blob missing for {url}, refetching')
+            with self._lock:
+                row = self._db.execute('SELECT size FROM blobs WHERE digest = ?', (digest,)).fetchone()
+                if row:
+                    self._total -= row[0]
+                self._db.execute('DELETE FROM blobs WHERE digest = ?', (digest,))
+                self._db.execute('DELETE FROM urls WHERE digest = ?', (digest,))
+                self._db.commit()
+            return None
+        now = time.time()
+        with self._lock:
+            self._db.execute('UPDATE blobs SET last_access = ? WHERE digest = ?', (now, digest))
+            if revalidated:
+                self._db.execute('UPDATE urls SET checked_at = ? WHERE url = ?', (now, url))
+            self._db.commit()
+            self.stats['hits'] += 1
+            self.stats['bytes_served'] += len(data)
+            if revalidated:
+                self.stats['revalidated'] += 1
+        METRICS.count('image_cache.hits')
+        return data
+
+    def get_blob(self, digest):
+        try:
+            with open(self._blob_path(digest), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        with self._lock:
+            self._db.execute('UPDATE blobs SET last_access = ? WHERE digest = ?', (time.time(), digest))
+            self._db.commit()
+        return data
+
+    def put_blob(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self._write_blob(digest, data, time.time())
+            self._evict()
+            self._db.commit()
+        return digest
+
+    def _write_blob(self, digest, data, now):
+        path = self._blob_path(digest)
+        if self._db.execute('SELECT 1 FROM blobs WHERE digest = ?', (digest,)).fetchone():
+            self.stats['deduplicated'] += 1
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+            self._total += len(data)
+        self._db.execute(
+            'INSERT OR REPLACE INTO blobs (digest, size, last_access) VALUES (?, ?, ?)',
+            (digest, len(data), now)
+        )
+
+    def _store(self, url, data, etag, last_modified):
+        digest = hashlib.sha256(data).hexdigest()
+        now = time.time()
+        with self._lock:
+            self._write_blob(digest, data, now)
+            self._db.execute(
+                'INSERT OR REPLACE INTO urls (url, digest, etag, last_modified, checked_at) VALUES (?, ?, ?, ?, ?)',
+                (url, digest, etag, last_modified, now)
+            )
+            self._evict()
+            self._db.commit()
+        return digest
+
+    def _evict(self):
+        if self._total <= self.max_bytes:
+            return
+        rows = self._db.execute('SELECT digest, size FROM blobs ORDER BY last_access').fetchall()
+        for digest, size in rows:
+            if self._total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._blob_path(digest))
+            except OSError as e:
+                logging.warning(f'Could not remove cached blob {digest}: {e}')
+            self._db.execute('DELETE FROM blobs WHERE digest = ?', (digest,))
+            self._db.execute('DELETE FROM urls WHERE digest = ?', (digest,))
+            self._total -= size
+            self.stats['evicted'] += 1
+
+    def fetch(self, session, url, max_bytes=MAX_IMAGE_BYTES, limiter=None):
+        entry = self._lookup(url)
+        if entry and self.fresh_for and time.time() - entry[3] < self.fresh_for:
+            data = self._read_blob(url, entry[0])
+            if data is not None:
+                return data
+            entry = None
+        headers = {}
+        if entry:
+            if entry[1]:
+                headers['If-None-Match'] = entry[1]
+            if entry[2]:
+                headers['If-Modified-Since'] = entry[2]
+
+        with limiter.slot(url) if limiter is not None else nullcontext(), \
+                session.get(url, stream=True, timeout=HTTP_TIMEOUT, headers=headers) as response:
+            not_modified = response.status_code == 304 and entry
+            if not not_modified:
+                response.raise_for_status()
+                data = read_body(response, max_bytes)
+        if not_modified:
+            data = self._read_blob(url, entry[0], revalidated=True)
+            if data is not None:
+                return data
+            return self.fetch(session, url, max_bytes, limiter)
+
+        with self._lock:
+            self.stats['misses'] += 1
+            self.stats['bytes_downloaded'] += len(data)
+        METRICS.count('image_cache.misses')
+        self._store(url, data, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return data
+
+    def log_stats(self):
+        stats = self.stats
+        lookups = stats['hits'] + stats['misses']
+        hit_rate = stats['hits'] / lookups if lookups else 0
+        logging.info(f'Image cache: {stats["hits"]} hits ({stats["revalidated"]} revalidated), '
+                     f'{stats["misses"]} misses, hit rate {hit_rate:.1%}, '
+                     f'{stats["deduplicated"]} deduplicated, {stats["evicted"]} evicted, '
+                     f'{stats["bytes_downloaded"]} bytes downloaded, {stats["bytes_served"]} bytes served from cache, '
+                     f'{self._total} bytes stored')
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def download_images(sources, workers=DOWNLOAD_WORKERS, session=None, limiter=None, cache=None):
+    session = session or make_session(pool_size=workers)
+    unique_sources = list(dict.fromkeys(source for source in sources if source))
+
+    def get(source):
+        if cache is not None:
+            return cache.fetch(session, source, limiter=limiter)
+        if limiter is not None:
+            with limiter.slot(source):
+                return download_image(session, source)
+        return download_image(session, source)
+
+    def fetch(source):
+        try:
+            with METRICS.timer('download.image', source):
+                data = get(source)
+            logging.debug(f'Downloaded {len(data)} bytes from {source}')
+            METRICS.count('images_downloaded')
+            METRICS.count('download_bytes', len(data))
+            return source, data
+        except Exception as e:
+            logging.error(f'Failed to download image: {source}\nException: {e}')
+            METRICS.count('download_failures')
+            return source, None
+
+    logging.info(f'Downloading {len(unique_sources)} unique images with {workers} workers')
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        image_bytes = dict(executor.map(fetch, unique_sources))
+    failed = sum(1 for data in image_bytes.values() if data is None)
+    logging.info(f'Downloaded {len(image_bytes) - failed} images, {failed} failed')
+    if cache is not None:
+        cache.log_stats()
+    return image_bytes
+
+
+def is_svg(data):
+    head = data[:1024].lstrip().lower()
+    return head.startswith(b'<svg') or (head.startswith(b'<?xml') and b'<svg' in head)
+
+
+def make_thumbnail(data, max_size=THUMBNAIL_SIZE):
+    if is_svg(data):
+        if cairosvg is None:
+            raise ValueError('SVG thumbnails require cairosvg')
+        data = cairosvg.svg2png(bytestring=data, output_width=max_size[0] * 4)
+
+    with PILImage.open(BytesIO(data)) as img:
+        if getattr(img, 'is_animated', False):
+            img.seek(0)
+        return thumbnail_image(img, max_size)
+
+
+def thumbnail_image(img, max_size=THUMBNAIL_SIZE):
+    width, height = img.size
+    scale = min(max_size[0] / width, max_size[1] / height)
+    new_size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    if img.format == 'JPEG' and scale < 1:
+        img.draft('RGB', new_size)
+    if img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        img = img.convert('RGBA' if 'transparency' in img.info or img.mode in ('P', 'PA') else 'RGB')
+    if scale < 1:
+        img.thumbnail(new_size, PILImage.Resampling.LANCZOS, reducing_gap=2.0)
+        resized_img = img if img.size == new_size else img.resize(new_size, PILImage.Resampling.LANCZOS)
+    else:
+        resized_img = img.resize(new_size, PILImage.Resampling.LANCZOS)
+    buffer = BytesIO()
+    resized_img.save(buffer, format='PNG', compress_level=3)
+    return buffer.getvalue(), new_size[0], new_size[1]
+
+
+def thumbnail_worker(item):
+    source, data = item
+    try:
+        return source, make_thumbnail(data), None
+    except Exception as e:
+        return source, None, str(e)
+
+
+def make_thumbnails(image_bytes, workers=THUMBNAIL_WORKERS, executor=None):
+    items = [(source, data) for source, data in image_bytes.items() if data is not None]
+    if executor is not None:
+        results = executor.map(thumbnail_worker, items, chunksize=8)
+    elif workers > 1 and len(items) >= THUMBNAIL_POOL_MIN_IMAGES:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(thumbnail_worker, items, chunksize=8))
+    else:
+        results = map(thumbnail_worker, items)
+
+    thumbnails = {}
+    for source, thumbnail, error in results:
+        if error:
+            logging.error(f'Could not create thumbnail for {source}: {error}')
+        thumbnails[source] = thumbnail
+    return thumbnails
+
+
+def hamming_distance(first, second):
+    return bin(first ^ second).count('1')
+
+
+def image_fingerprint(data):
+    digest = hashlib.sha256(data).hexdigest()
+    if is_svg(data):
+        return digest, None, None
+    try:
+        with PILImage.open(BytesIO(data)) as img:
+            if getattr(img, 'is_animated', False):
+                img.seek(0)
+            if img.format == 'JPEG':
+                img.draft('L', (DHASH_SIZE * 8, DHASH_SIZE * 8))
+            return image_dhash(img, digest)
+    except Exception as e:
+        logging.debug(f'Could not compute perceptual hash: {e}')
+        return digest, None, None
+
+
+def image_dhash(img, digest, size=None):
+    width, height = size or img.size
+    pixels = img.convert('L').resize((DHASH_SIZE + 1, DHASH_SIZE), PILImage.Resampling.BOX).tobytes()
+    if min(width, height) < PHASH_MIN_SIDE or max(pixels) - min(pixels) < PHASH_MIN_CONTRAST:
+        return digest, None, None
+    value = 0
+    for row in range(DHASH_SIZE):
+        for column in range(DHASH_SIZE):
+            index = row * (DHASH_SIZE + 1) + column
+            value = value << 1 | (pixels[index] > pixels[index + 1])
+    return digest, value, width / height
+
+
+def avif_supported():
+    PILImage.init()
+    return 'AVIF' in PILImage.SAVE
+
+
+def encoded_size(img, image_format, **options):
+    buffer = BytesIO()
+    img.save(buffer, format=image_format, quality=AUDIT_QUALITY, **options)
+    return buffer.tell()
+
+
+def reencoded_sizes(img, image_format):
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'transparency' in img.info or img.mode in ('P', 'PA', 'LA') else 'RGB')
+    webp_bytes = encoded_size(img, 'WEBP', method=4) if image_format != 'WEBP' else None
+    avif_bytes = None
+    if image_format != 'AVIF' and avif_supported():
+        avif_bytes = encoded_size(img, 'AVIF', speed=AUDIT_AVIF_SPEED)
+    return webp_bytes, avif_bytes
+
+
+def should_reencode(img, data):
+    return len(data) >= AUDIT_MIN_BYTES and not getattr(img, 'is_animated', False)
+
+
+def analyze_image(data, reencode=True):
+    digest = hashlib.sha256(data).hexdigest()
+    if is_svg(data):
+        try:
+            thumbnail, error = make_thumbnail(data), None
+        except Exception as e:
+            thumbnail, error = None, str(e)
+        return thumbnail, error, (digest, None, None), (len(data), 'SVG', None, None, None, None)
+    try:
+        with PILImage.open(BytesIO(data)) as img:
+            if getattr(img, 'is_animated', False):
+                img.seek(0)
+            image_format = img.format
+            width, height = img.size
+            audit = (len(data), image_format, width, height, None, None)
+            if reencode and should_reencode(img, data):
+                audit = (*audit[:4], *reencoded_sizes(img, image_format))
+            elif image_format == 'JPEG':
+                img.draft('RGB', (THUMBNAIL_SIZE[0] * 2, THUMBNAIL_SIZE[1] * 2))
+            fingerprint = image_dhash(img, digest, (width, height))
+            return thumbnail_image(img), None, fingerprint, audit
+    except Exception as e:
+        return None, str(e), (digest, None, None), (len(data), None, None, None, None, None)
+
+
+def audit_values(audit, rendered_size):
+    size, image_format, width, height, webp_bytes, avif_bytes = audit
+    intrinsic = f'{width}x{height}' if width else None
+    rendered = f'{rendered_size[0]}x{rendered_size[1]}' if rendered_size and rendered_size[0] else None
+    smallest = min((value for value in (webp_bytes, avif_bytes) if value is not None), default=None)
+    savings = max(0, size - smallest) if size is not None and smallest is not None else None
+    return size, image_format, intrinsic, rendered, webp_bytes, avif_bytes, savings
+
+
+def fingerprint_worker(item):
+    source, data = item
+    return source, image_fingerprint(data)
+
+
+class BKTree:
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value_hash, value):
+        node = (value_hash, value, {})
+        self.size += 1
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming_distance(current[0], value_hash)
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, value_hash, max_distance):
+        results = []
+        pending = [self.root] if self.root is not None else []
+        while pending:
+            node_hash, value, children = pending.pop()
+            distance = hamming_distance(node_hash, value_hash)
+            if distance <= max_distance:
+                results.append((distance, value))
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    pending.append(child)
+        results.sort(key=lambda result: result[0])
+        return results
+
+
+class ImageClusterIndex:
+    def __init__(self, max_distance=PHASH_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.clusters = {}
+        self._tree = BKTree()
+        self._by_digest = {}
+        self._lock = threading.Lock()
+
+    def add(self, source, fingerprint):
+        digest, value_hash, aspect = fingerprint
+        with self._lock:
+            representative = self._by_digest.get(digest)
+            if representative is None and value_hash is not None:
+                for _, (candidate, candidate_aspect) in self._tree.search(value_hash, self.max_distance):
+                    if abs(candidate_aspect - aspect) <= PHASH_ASPECT_TOLERANCE * max(candidate_aspect, aspect):
+                        representative = candidate
+                        break
+            if representative is None:
+                representative = source
+                if value_hash is not None:
+                    self._tree.add(value_hash, (source, aspect))
+            self._by_digest.setdefault(digest, representative)
+            self.clusters[source] = representative
+            return representative
+
+    def log_stats(self):
+        with self._lock:
+            images = len(self.clusters)
+            clusters = len(set(self.clusters.values()))
+        logging.info(f'Image dedup: {images} images in {clusters} clusters of identical or near-identical images')
+
+
+def cluster_images(image_bytes, max_distance=PHASH_MAX_DISTANCE, workers=THUMBNAIL_WORKERS, executor=None):
+    items = [(source, data) for source, data in image_bytes.items() if data is not None]
+    if executor is not None:
+        results = executor.map(fingerprint_worker, items, chunksize=8)
+    elif workers > 1 and len(items) >= THUMBNAIL_POOL_MIN_IMAGES:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(fingerprint_worker, items, chunksize=8))
+    else:
+        results = map(fingerprint_worker, items)
+
+    index = ImageClusterIndex(max_distance)
+    for source, fingerprint in results:
+        index.add(source, fingerprint)
+    index.log_stats()
+    return index.clusters
+
+
+def write_to_excel(image_arr, excel_filename, sheet_name, image_bytes=None, cache=None):
     try:
         logging.info('Instantiating dataframe')
         img_df = pd.DataFrame(image_arr, columns=['Src', 'Url', 'Alt'])
@@ -399,28 +2492,25 @@ def write_to_excel(image_arr, excel_filename, sheet_name):
     ws['C1'] = 'Url'
     ws['D1'] = 'Alt'
 
-    remove_files = []
+    image_bytes = dict(image_bytes or {})
+    missing = [source for source in img_df['Src'] if source not in image_bytes]
+    if missing:
+        with METRICS.timer('excel.download'):
+            image_bytes.update(download_images(missing, cache=cache))
+
+    with METRICS.timer('excel.thumbnails'):
+        thumbnails = make_thumbnails({source: image_bytes.get(source) for source in img_df['Src']})
+    METRICS.count('excel_rows', len(img_df))
     for index, row in img_df.iterrows():
-        img_filename = None
-        try:
-            logging.info(f'Attempting to download image from {row["Src"]}')
-            img_url = row['Src']
-            response = requests.get(img_url, stream=True)
-            response.raise_for_status()
-            img = PILImage.open(BytesIO(response.content))
-            img_filename = f"{sheet_name}image{index + 1}.png"
-            img.save(img_filename)
-            remove_files.append(img_filename)
-            logging.info(f'Successfully downloaded image with filename {img_filename}')
-        except Exception as e:
-            logging.error(f'Failed to download image: {e}')
-            img_filename = None
+        thumbnail = thumbnails.get(row['Src'])
+        if thumbnail is None:
+            logging.error(f'Failed to download image: {row["Src"]}')
 
         try:
             logging.info(f'Creating row with values {row["Src"]} {row["Url"]} {row["Alt"]}')
-            if img_filename and os.path.exists(img_filename):
-                new_width, new_height = resize_image(img_filename)
-                img = Image(img_filename)
+            if thumbnail is not None:
+                png, new_width, new_height = thumbnail
+                img = Image(BytesIO(png))
                 cell = f'A{index + 2}'
                 ws.add_image(img, cell)
                 ws.column_dimensions[cell[0]].width = new_width / 7
@@ -437,37 +2527,184 @@ def write_to_excel(image_arr, excel_filename, sheet_name):
 
     try:
         logging.info(f'Saving workbook to {excel_filename}')
-        wb.save(excel_filename)
+        with METRICS.timer('excel.save'):
+            wb.save(excel_filename)
     except PermissionError as e:
         logging.error(f'Permission denied while saving workbook: {e}')
     except Exception as e:
         logging.error(f'Error saving workbook: {e}')
+    return image_bytes
+
+
+class ReportWriter:
+    def __init__(self, output_path, sheet_name='Images', fmt='xlsx', columns=None,
+                 rows_per_part=REPORT_ROWS_PER_PART, thumbnail_dir=None, on_checkpoint=None):
+        if fmt not in ('xlsx', 'csv', 'parquet'):
+            raise ValueError(f'Unsupported report format: {fmt}')
+        if fmt == 'parquet' and pq is None:
+            raise ImportError('pyarrow is required for parquet reports')
+        self.fmt = fmt
+        self.sheet_name = sheet_name
+        self.columns = list(columns or REPORT_COLUMNS)
+        self.rows_per_part = rows_per_part
+        self.on_checkpoint = on_checkpoint
+        self.base = os.path.splitext(output_path)[0]
+        self.thumbnail_dir = thumbnail_dir or f'{self.base}_thumbnails'
+        self.progress_path = f'{self.base}.progress.json'
+        os.makedirs(self.thumbnail_dir, exist_ok=True)
+
+        progress = self._load_progress()
+        self.rows_written = progress['rows']
+        self.parts = progress['parts']
+        self._offset = progress['offset']
+        self._part_rows = 0
+        self._workbook = None
+        self._sheet = None
+        self._buffer = []
+        self._part_sources = []
+        self._csv_file = None
+        self._csv_writer = None
+        if self.rows_written:
+            logging.info(f'Resuming report {self.base} after {self.rows_written} rows')
+        else:
+            for path in glob.glob(f'{glob.escape(self.base)}_part*'):
+                os.remove(path)
+        if fmt == 'csv':
+            self._open_csv()
 
-    for file in remove_files:
+    def _load_progress(self):
+        empty = {'rows': 0, 'parts': 0, 'offset': 0, 'complete': False}
         try:
-            if os.path.exists(file):
-                os.remove(file)
-                logging.info(f'Successfully removed file : {file}')
+            with open(self.progress_path) as f:
+                progress = json.load(f)
+        except (OSError, ValueError):
+            return empty
+        return empty if progress.get('complete') else progress
+
+    def _save_progress(self, complete=False):
+        progress = {'rows': self.rows_written, 'parts': self.parts, 'offset': self._offset, 'complete': complete}
+        temp_path = f'{self.progress_path}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(progress, f)
+        os.replace(temp_path, self.progress_path)
+
+    def _part_path(self, extension):
+        return f'{self.base}_part{self.parts + 1:04d}.{extension}'
+
+    def _open_csv(self):
+        path = f'{self.base}.csv'
+        if self.rows_written and os.path.exists(path):
+            self._csv_file = open(path, 'r+', newline='', encoding='utf-8')
+            self._csv_file.truncate(self._offset)
+            self._csv_file.seek(self._offset)
+            self._csv_writer = csv.writer(self._csv_file)
+        else:
+            self._csv_file = open(path, 'w', newline='', encoding='utf-8')
+            self._csv_writer = csv.writer(self._csv_file)
+            self._csv_writer.writerow(['Thumbnail', *self.columns])
+
+    def _open_workbook(self):
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet(self.sheet_name)
+        self._sheet.column_dimensions['A'].width = THUMBNAIL_SIZE[0] / 7
+        self._sheet.append(['Image', *self.columns])
+
+    def _save_thumbnail(self, source, thumbnail):
+        name = hashlib.sha1(source.encode('utf-8')).hexdigest()
+        path = os.path.join(self.thumbnail_dir, f'{name}.png')
+        with open(path, 'wb') as f:
+            f.write(thumbnail[0])
+        return path
+
+    def write(self, values, thumbnail=None):
+        source = values[0]
+        thumbnail_path = self._save_thumbnail(source, thumbnail) if thumbnail else None
+
+        if self.fmt == 'xlsx':
+            if self._workbook is None:
+                self._open_workbook()
+            row_index = self._part_rows + 2
+            if thumbnail_path:
+                img = Image(thumbnail_path)
+                img.anchor = f'A{row_index}'
+                self._sheet.add_image(img)
+                self._sheet.row_dimensions[row_index].height = thumbnail[2] / 0.75
+                self._sheet.append([None, *values])
             else:
-                logging.error('Trying to remove a path that doesnt exist')
-        except Exception as e:
-            logging.error(f'Error removing file {file}')
+                self._sheet.append(['Failed to download image', *values])
+        elif self.fmt == 'csv':
+            self._csv_writer.writerow([thumbnail_path or '', *values])
+        else:
+            self._buffer.append([thumbnail_path or '', *values])
+
+        self.rows_written += 1
+        self._part_rows += 1
+        self._part_sources.append(source)
+        if self._part_rows >= self.rows_per_part:
+            self.checkpoint()
+
+    def checkpoint(self):
+        if not self._part_rows:
+            return
+        if self.fmt == 'xlsx':
+            path = self._part_path('xlsx')
+            self._workbook.save(path)
+            self._workbook = None
+            self._sheet = None
+            self.parts += 1
+        elif self.fmt == 'csv':
+            self._csv_file.flush()
+            os.fsync(self._csv_file.fileno())
+            self._offset = self._csv_file.tell()
+        else:
+            path = self._part_path('parquet')
+            names = ['Thumbnail', *self.columns]
+            table = pa.table({name: [row[i] for row in self._buffer] for i, name in enumerate(names)})
+            pq.write_table(table, path)
+            self._buffer = []
+            self.parts += 1
+        self._part_rows = 0
+        self._save_progress()
+        sources, self._part_sources = self._part_sources, []
+        if self.on_checkpoint is not None:
+            self.on_checkpoint(sources)
+        logging.info(f'Report checkpoint: {self.rows_written} rows written to {self.base}')
+
+    def close(self, complete=True):
+        self.checkpoint()
+        if self._csv_file is not None:
+            self._csv_file.close()
+        self._save_progress(complete)
+        if complete:
+            logging.info(f'Finished report {self.base} with {self.rows_written} rows')
+        else:
+            logging.info(f'Closed report {self.base} after {self.rows_written} rows, it resumes on the next run')
 
 
-def alt_generator(source, url, alt):
-    try:
-        response = requests.get(source, stream=True)
-        response.raise_for_status()
-        img = PILImage.open(BytesIO(response.content))
-        img_filename = "target_image.png"
-        img.save(img_filename)
-        logging.info(f"Successfully downloaded image from {source}")
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Couldn't fetch image from {source}\nException: {e}")
-        return "Could not fetch the image"
+def write_report_streaming(image_arr, output_path, sheet_name='Images', fmt='xlsx', cache=None,
+                           chunk_size=REPORT_CHUNK_SIZE, rows_per_part=REPORT_ROWS_PER_PART, thumbnail_dir=None,
+                           workers=THUMBNAIL_WORKERS):
+    writer = ReportWriter(output_path, sheet_name, fmt, rows_per_part=rows_per_part, thumbnail_dir=thumbnail_dir)
+    session = make_session(pool_size=DOWNLOAD_WORKERS)
+    rows = iter(image_arr)
+    for _ in range(writer.rows_written):
+        next(rows, None)
 
-    try:
-        prompt = f"""
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            chunk = [row for _, row in zip(range(chunk_size), rows)]
+            if not chunk:
+                break
+            image_bytes = download_images([row[0] for row in chunk], session=session, cache=cache)
+            thumbnails = make_thumbnails(image_bytes, executor=executor)
+            for row in chunk:
+                writer.write(row, thumbnails.get(row[0]))
+    writer.close()
+    return writer
+
+
+def build_alt_prompt(source, url, alt, img_filename='target_image.png'):
+    return f"""
             You are given an image stored in the local file system with the name {img_filename}.
             Provide a alt tag for this image to optimize search engine results. Here are additional details:
             - Source URL: {source}
@@ -476,10 +2713,355 @@ def alt_generator(source, url, alt):
             Please generate a descriptive alternative text (alt) for the image.
             """
 
-        chatgpt_response = ask_chatgpt(prompt)
-        updated_alt_text = chatgpt_response.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
+
+def build_batch_alt_prompt(jobs):
+    details = '\n'.join(
+        f"""
+            Image {number}:
+            - Source URL: {source}
+            - Original Alt Text: {alt}
+            - Page URL: {url}"""
+        for number, (_, source, url, alt) in enumerate(jobs, start=1)
+    )
+    return f"""
+            Provide an alt tag for each of the following {len(jobs)} images to optimize search engine results.
+            {details}
+
+            Respond only with a JSON array of {len(jobs)} strings, one descriptive alternative text (alt) per image,
+            in the same order as the images above.
+            """
+
+
+def response_content(chatgpt_response):
+    return chatgpt_response.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
+
+
+def parse_batch_content(content, expected):
+    content = content.strip()
+    if content.startswith('```'):
+        content = content.strip('`')
+        content = content[content.find('['):]
+    try:
+        alts = json.loads(content)
+    except ValueError:
+        return None
+    if not isinstance(alts, list) or len(alts) != expected:
+        return None
+    return [str(alt).strip() for alt in alts]
+
+
+def estimate_tokens(prompt, max_tokens):
+    return len(prompt) // 4 + max_tokens
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class RateBudget:
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self._available = float(per_minute or 0)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        if not self.per_minute:
+            return
+        amount = min(amount, self.per_minute)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._available = min(self.per_minute,
+                                      self._available + (now - self._updated) * self.per_minute / 60)
+                self._updated = now
+                if self._available >= amount:
+                    self._available -= amount
+                    return
+                wait = (amount - self._available) * 60 / self.per_minute
+            time.sleep(wait)
+
+    def settle(self, reserved, used):
+        if not self.per_minute:
+            return
+        with self._lock:
+            self._available = min(self.per_minute, self._available + reserved - used)
+
+
+class AltTextScheduler:
+    def __init__(self, concurrency=ALT_CONCURRENCY, requests_per_minute=ALT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=ALT_TOKENS_PER_MINUTE, batch_size=1, max_retries=ALT_MAX_RETRIES,
+                 api_url=None, request_budget=None, token_budget=None):
+        self.concurrency = concurrency
+        self.batch_size = max(1, batch_size)
+        self.max_retries = max_retries
+        self.api_url = api_url
+        self.request_budget = request_budget or RateBudget(requests_per_minute)
+        self.token_budget = token_budget or RateBudget(tokens_per_minute)
+        self.session = make_session(pool_size=concurrency)
+        self.latencies = deque(maxlen=ALT_LATENCY_SAMPLES)
+        self.stats = {'requests': 0, 'retries': 0, 'rate_limited': 0, 'failed': 0, 'images': 0}
+        self._lock = threading.Lock()
+        self._resume_at = 0.0
+
+    def _wait_for_backoff(self):
+        while True:
+            with self._lock:
+                wait = self._resume_at - time.monotonic()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def _retry_delay(self, attempt, response):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        try:
+            return float(retry_after)
+        except (TypeError, ValueError):
+            return min(60, 2 ** attempt) + random.uniform(0, 1)
+
+    def _send(self, prompt, max_tokens):
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_backoff()
+            self.request_budget.acquire()
+            reserved = min(estimate_tokens(prompt, max_tokens), self.token_budget.per_minute or 0)
+            self.token_budget.acquire(reserved)
+            started = time.monotonic()
+            response = None
+            try:
+                result = ask_chatgpt(prompt, session=self.session, api_url=self.api_url, max_tokens=max_tokens)
+                used = (result.get('usage') or {}).get('total_tokens')
+                if used is not None:
+                    self.token_budget.settle(reserved, used)
+                with self._lock:
+                    self.stats['requests'] += 1
+                    self.latencies.append(time.monotonic() - started)
+                return result
+            except requests.exceptions.HTTPError as e:
+                response = e.response
+                status = response.status_code if response is not None else None
+                if status != 429 and (status is None or status < 500):
+                    raise
+                error = e
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+            delay = self._retry_delay(attempt, response)
+            with self._lock:
+                self.stats['requests'] += 1
+                if response is not None and response.status_code == 429:
+                    self.stats['rate_limited'] += 1
+                    METRICS.count('chatgpt.rate_limited')
+                    self._resume_at = max(self._resume_at, time.monotonic() + delay)
+            if attempt == self.max_retries:
+                break
+            with self._lock:
+                self.stats['retries'] += 1
+            METRICS.count('chatgpt.retries')
+            logging.warning(f'Alt text request failed ({error}), retrying in {delay:.1f}s')
+            time.sleep(delay)
+        raise RuntimeError(f'Alt text request failed after {self.max_retries} retries')
+
+    def _run_single(self, job):
+        key, source, url, alt = job
+        try:
+            content = response_content(self._send(build_alt_prompt(source, url, alt), ALT_MAX_TOKENS))
+            logging.info(f"Generated alt text: {content}")
+            return {key: content}
+        except Exception as e:
+            logging.error(f"Error during alt text generation for {source}\nException: {e}")
+            with self._lock:
+                self.stats['failed'] += 1
+            return {key: ALT_ERROR_TEXT}
+
+    def _run_batch(self, jobs):
+        if len(jobs) == 1:
+            return self._run_single(jobs[0])
+        try:
+            content = response_content(self._send(build_batch_alt_prompt(jobs), ALT_MAX_TOKENS * len(jobs)))
+            alts = parse_batch_content(content, len(jobs))
+        except Exception as e:
+            logging.error(f'Error during batched alt text generation\nException: {e}')
+            alts = None
+        if alts is None:
+            logging.warning(f'Batch of {len(jobs)} images did not return usable alt texts, sending individually')
+            results = {}
+            for job in jobs:
+                results.update(self._run_single(job))
+            return results
+        return {job[0]: alt for job, alt in zip(jobs, alts)}
+
+    def run(self, jobs):
+        jobs = list(jobs)
+        batches = [jobs[i:i + self.batch_size] for i in range(0, len(jobs), self.batch_size)]
+        results = {}
+        with self._lock:
+            before = dict(self.stats)
+            self.latencies.clear()
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for batch_results in executor.map(self._run_batch, batches):
+                results.update(batch_results)
+        with self._lock:
+            self.stats['images'] += len(jobs)
+            run_stats = {name: value - before[name] for name, value in self.stats.items()}
+            latencies = list(self.latencies)
+        self.report(run_stats, latencies, time.monotonic() - started)
+        return results
+
+    def report(self, stats, latencies, elapsed):
+        throughput = stats['images'] / elapsed if elapsed else 0
+        logging.info(f'Alt text: {stats["images"]} images in {elapsed:.1f}s ({throughput:.2f} images/s), '
+                     f'{stats["requests"]} requests, {stats["retries"]} retries '
+                     f'({stats["rate_limited"]} rate limited), {stats["failed"]} failed, '
+                     f'latency p50={percentile(latencies, 0.5):.2f}s '
+                     f'p95={percentile(latencies, 0.95):.2f}s p99={percentile(latencies, 0.99):.2f}s')
+
+
+def alt_cache_key(image_bytes):
+    parameters = json.dumps({
+        'prompt_version': ALT_PROMPT_VERSION,
+        'model': CHATGPT_MODEL,
+        'max_tokens': ALT_MAX_TOKENS,
+        'temperature': CHATGPT_TEMPERATURE,
+    }, sort_keys=True)
+    digest = hashlib.sha256(hashlib.sha256(image_bytes).digest())
+    digest.update(parameters.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class AltTextCache:
+    def __init__(self, path=ALT_CACHE_PATH, ttl=ALT_CACHE_TTL, max_entries=ALT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evicted': 0}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS alts (
+                key TEXT PRIMARY KEY,
+                alt TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS alts_last_access ON alts (last_access);
+        """)
+        self._count = self._db.execute('SELECT COUNT(*) FROM alts').fetchone()[0]
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute('SELECT alt, created_at FROM alts WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                METRICS.count('alt_cache.misses')
+                return None
+            if self.ttl and now - row[1] > self.ttl:
+                self._db.execute('DELETE FROM alts WHERE key = ?', (key,))
+                self._db.commit()
+                self._count -= 1
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                METRICS.count('alt_cache.misses')
+                return None
+            self._db.execute('UPDATE alts SET last_access = ? WHERE key = ?', (now, key))
+            self._db.commit()
+            self.stats['hits'] += 1
+            METRICS.count('alt_cache.hits')
+            return row[0]
+
+    def put(self, key, alt):
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute('UPDATE alts SET alt = ?, created_at = ?, last_access = ? WHERE key = ?',
+                                      (alt, now, now, key))
+            if not cursor.rowcount:
+                self._db.execute('INSERT INTO alts (key, alt, created_at, last_access) VALUES (?, ?, ?, ?)',
+                                 (key, alt, now, now))
+                self._count += 1
+            if self._count > self.max_entries:
+                excess = self._count - self.max_entries
+                self._db.execute(
+                    'DELETE FROM alts WHERE key IN (SELECT key FROM alts ORDER BY last_access LIMIT ?)', (excess,)
+                )
+                self._count -= excess
+                self.stats['evicted'] += excess
+            self._db.commit()
+
+    def log_stats(self):
+        logging.info(f'Alt text cache: {self.stats["hits"]} hits, {self.stats["misses"]} misses, '
+                     f'{self.stats["expired"]} expired, {self.stats["evicted"]} evicted, {self._count} entries')
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def generate_alt_texts(rows, image_bytes, scheduler=None, alt_cache=None, clusters=None):
+    clusters = clusters or {}
+    results = {}
+    pending = {}
+    cached_rows = 0
+    for row_key, source, url, alt in rows:
+        data = image_bytes.get(clusters.get(source, source))
+        if data is None:
+            results[row_key] = 'Could not fetch the image'
+            continue
+        key = alt_cache_key(data)
+        cached = alt_cache.get(key) if alt_cache is not None else None
+        if cached is not None:
+            results[row_key] = cached
+            cached_rows += 1
+            continue
+        pending.setdefault(key, []).append((row_key, source, url, alt))
+
+    if pending:
+        jobs = [(key, *group[0][1:]) for key, group in pending.items()]
+        scheduler = scheduler or AltTextScheduler()
+        generated = scheduler.run(jobs)
+        for key, group in pending.items():
+            updated_alt = generated.get(key, ALT_ERROR_TEXT)
+            if alt_cache is not None and updated_alt != ALT_ERROR_TEXT:
+                alt_cache.put(key, updated_alt)
+            for row in group:
+                results[row[0]] = updated_alt
+
+    logging.info(f'Alt text for {len(rows)} rows: {len(pending)} unique images sent to the model '
+                 f'for {sum(len(group) for group in pending.values())} rows, {cached_rows} rows served from cache')
+    if alt_cache is not None:
+        alt_cache.log_stats()
+    return results
+
+
+def alt_generator(source, url, alt, image_bytes=None, alt_cache=None):
+    try:
+        if image_bytes is None:
+            image_bytes = download_image(get_session(), source)
+        img = PILImage.open(BytesIO(image_bytes))
+        img_filename = "target_image.png"
+        img.save(img_filename)
+        logging.info(f"Successfully downloaded image from {source}")
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logging.error(f"Couldn't fetch image from {source}\nException: {e}")
+        return "Could not fetch the image"
+
+    key = alt_cache_key(image_bytes)
+    if alt_cache is not None:
+        cached = alt_cache.get(key)
+        if cached is not None:
+            logging.info(f"Using cached alt text for {source}")
+            return cached
+
+    try:
+        prompt = build_alt_prompt(source, url, alt, img_filename)
+
+        chatgpt_response = ask_chatgpt(prompt, max_tokens=ALT_MAX_TOKENS)
+        updated_alt_text = response_content(chatgpt_response)
 
         logging.info(f"Generated alt text: {updated_alt_text}")
+        if alt_cache is not None:
+            alt_cache.put(key, updated_alt_text)
         return updated_alt_text
 
     except Exception as e:
@@ -487,7 +3069,8 @@ def alt_generator(source, url, alt):
         return {"Error generating alt text"}
 
 
-def alt_writer(excel_filename, sheet_name, alt):
+def alt_writer(excel_filename, sheet_name, alt, image_bytes=None, cache=None, scheduler=None, alt_cache=None,
+               dedupe=True):
     try:
         logging.info('Instantiating Workbook and Sheet')
         wb = load_workbook(excel_filename)
@@ -505,12 +3088,28 @@ def alt_writer(excel_filename, sheet_name, alt):
     except Exception as e:
         logging.error('Couldnt load info into dataframe')
 
+    image_bytes = dict(image_bytes or {})
+    missing = [source for source in image_df['Src'] if source not in image_bytes]
+    if missing:
+        image_bytes.update(download_images(missing, cache=cache))
+
+    rows = []
     for index, row in image_df.iterrows():
         try:
             logging.info(f'Row {index + 1}: Src={row["Src"]}, Url={row["Url"]}, Alt={row["Alt"]}')
-            ws[f'E{index + 2}'] = alt_generator(row['Src'], row['Url'], row['Alt'])
+            rows.append((index, row['Src'], row['Url'], row['Alt']))
         except Exception as e:
             logging.error('Couldnt print row')
+
+    clusters = cluster_images(image_bytes) if dedupe else None
+    for index, updated_alt in generate_alt_texts(rows, image_bytes, scheduler, alt_cache, clusters).items():
+        ws[f'E{index + 2}'] = updated_alt
+    if clusters:
+        ws['F1'] = 'Duplicate Of'
+        for index, source, _, _ in rows:
+            representative = clusters.get(source, source)
+            if representative != source:
+                ws[f'F{index + 2}'] = representative
     try:
         logging.info(f'Saving workbook to {excel_filename}')
         wb.save(excel_filename)
@@ -520,11 +3119,653 @@ def alt_writer(excel_filename, sheet_name, alt):
         logging.error(f'Error saving workbook: {e}')
 
 
-def main():
-    links = get_links2('https://pizzanini.no/')
-    for link in links:
-        print(link)
-    scrape_images(links)
+class PipelineStore:
+    def __init__(self, path, canonicalize=canonicalize_url):
+        self.path = path
+        self.canonicalize = canonicalize
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        page_columns = {row['name'] for row in self._db.execute('PRAGMA table_info(pages)')}
+        pages = []
+        if page_columns and 'key' not in page_columns:
+            pages = self._db.execute('SELECT url, scraped FROM pages').fetchall()
+            self._db.execute('DROP TABLE pages')
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                scraped INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS images (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                src TEXT NOT NULL UNIQUE,
+                page TEXT NOT NULL,
+                alt TEXT,
+                status TEXT NOT NULL,
+                updated_alt TEXT,
+                thumbnail BLOB,
+                thumbnail_width INTEGER,
+                thumbnail_height INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS images_status ON images (status, seq);
+        """)
+        columns = {row['name'] for row in self._db.execute('PRAGMA table_info(images)')}
+        for name, column_type in (('digest', 'TEXT'), ('dhash', 'TEXT'), ('aspect', 'REAL'), ('cluster', 'TEXT'),
+                                  ('rendered_width', 'INTEGER'), ('rendered_height', 'INTEGER'),
+                                  ('bytes', 'INTEGER'), ('format', 'TEXT'), ('width', 'INTEGER'),
+                                  ('height', 'INTEGER'), ('webp_bytes', 'INTEGER'), ('avif_bytes', 'INTEGER')):
+            if name not in columns:
+                self._db.execute(f'ALTER TABLE images ADD COLUMN {name} {column_type}')
+        self._db.executemany(
+            'INSERT INTO pages (key, url, scraped) VALUES (?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET scraped = MAX(scraped, excluded.scraped)',
+            [(canonicalize(page['url']), page['url'], page['scraped']) for page in pages]
+        )
+        self._db.commit()
+
+    def get_meta(self, key):
+        with self._lock:
+            row = self._db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row['value'] if row else None
+
+    def set_meta(self, key, value):
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+            self._db.commit()
+
+    def start(self, seed):
+        if self.get_meta('seed') == seed and self.get_meta('status') == 'running':
+            logging.info(f'Resuming pipeline for {seed}: {self.summary()}')
+            return False
+        with self._lock:
+            self._db.execute('DELETE FROM pages')
+            self._db.execute('DELETE FROM images')
+            self._db.execute('DELETE FROM meta')
+            self._db.commit()
+        self.set_meta('seed', seed)
+        self.set_meta('status', 'running')
+        logging.info(f'Starting pipeline for {seed}')
+        return True
+
+    def add_page(self, url):
+        with self._lock:
+            cursor = self._db.execute('INSERT OR IGNORE INTO pages (key, url) VALUES (?, ?)',
+                                      (self.canonicalize(url), url))
+            self._db.commit()
+        return bool(cursor.rowcount)
+
+    def unscraped_pages(self):
+        with self._lock:
+            rows = self._db.execute('SELECT url FROM pages WHERE scraped = 0').fetchall()
+        return [row['url'] for row in rows]
+
+    def known_sources(self):
+        with self._lock:
+            rows = self._db.execute('SELECT src FROM images').fetchall()
+        return {row['src'] for row in rows}
+
+    def record_scrape(self, page, images, rendered_sizes=None):
+        new_sources = []
+        rendered_sizes = rendered_sizes or {}
+        with self._lock:
+            for src, _, alt in images:
+                rendered_width, rendered_height = rendered_sizes.get(src, (None, None))
+                cursor = self._db.execute(
+                    'INSERT OR IGNORE INTO images (src, page, alt, status, rendered_width, rendered_height) '
+                    "VALUES (?, ?, ?, 'scraped', ?, ?)",
+                    (src, page, alt, rendered_width, rendered_height)
+                )
+                if cursor.rowcount:
+                    new_sources.append(src)
+            self._db.execute('UPDATE pages SET scraped = 1 WHERE key = ?', (self.canonicalize(page),))
+            self._db.commit()
+        return new_sources
+
+    def sources_with_status(self, *statuses):
+        placeholders = ', '.join('?' for _ in statuses)
+        with self._lock:
+            rows = self._db.execute(
+                f'SELECT src FROM images WHERE status IN ({placeholders}) ORDER BY seq', statuses
+            ).fetchall()
+        return [row['src'] for row in rows]
+
+    def set_downloaded(self, src, thumbnail, fingerprint, cluster, audit=None):
+        thumbnail = thumbnail or (None, None, None)
+        digest, value_hash, aspect = fingerprint
+        audit = audit or (None,) * 6
+        with self._lock:
+            self._db.execute(
+                "UPDATE images SET status = 'downloaded', thumbnail = ?, thumbnail_width = ?, thumbnail_height = ?, "
+                'digest = ?, dhash = ?, aspect = ?, cluster = ?, bytes = ?, format = ?, width = ?, height = ?, '
+                'webp_bytes = ?, avif_bytes = ? WHERE src = ?',
+                (*thumbnail, digest, None if value_hash is None else f'{value_hash:016x}', aspect, cluster, *audit,
+                 src)
+            )
+            self._db.commit()
+
+    def fingerprints(self):
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT src, digest, dhash, aspect FROM images WHERE digest IS NOT NULL ORDER BY seq'
+            ).fetchall()
+        return [(row['src'], (row['digest'], None if row['dhash'] is None else int(row['dhash'], 16), row['aspect']))
+                for row in rows]
+
+    def set_failed(self, src):
+        with self._lock:
+            self._db.execute("UPDATE images SET status = 'failed' WHERE src = ?", (src,))
+            self._db.commit()
+
+    def set_described(self, updated_alts):
+        with self._lock:
+            self._db.executemany(
+                "UPDATE images SET status = 'described', updated_alt = ? WHERE src = ?",
+                [(updated_alt, src) for src, updated_alt in updated_alts.items()]
+            )
+            self._db.commit()
+
+    def set_reported(self, sources):
+        with self._lock:
+            self._db.executemany("UPDATE images SET status = 'reported' WHERE src = ?", [(src,) for src in sources])
+            self._db.commit()
+
+    def image(self, src):
+        with self._lock:
+            return self._db.execute('SELECT * FROM images WHERE src = ?', (src,)).fetchone()
+
+    def summary(self):
+        with self._lock:
+            pages = self._db.execute('SELECT COUNT(*), COALESCE(SUM(scraped), 0) FROM pages').fetchone()
+            rows = self._db.execute('SELECT status, COUNT(*) FROM images GROUP BY status').fetchall()
+        counts = ', '.join(f'{row[1]} {row[0]}' for row in rows) or 'no images'
+        return f'{pages[1]}/{pages[0]} pages scraped, {counts}'
+
+    def unfinished(self):
+        with self._lock:
+            pages = self._db.execute('SELECT COUNT(*) FROM pages WHERE scraped = 0').fetchone()[0]
+            images = self._db.execute("SELECT COUNT(*) FROM images WHERE status != 'reported'").fetchone()[0]
+        return pages, images
+
+    def finish(self):
+        self.set_meta('status', 'complete')
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def stage_worker(inbox, handle):
+    while True:
+        item = inbox.get()
+        if item is STAGE_DONE:
+            inbox.put(STAGE_DONE)
+            return
+        try:
+            handle(item)
+        except Exception as e:
+            logging.error(f'Pipeline stage failed on {item}: {e}')
+
+
+def start_thread(target, name, *args):
+    thread = threading.Thread(target=target, args=args, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+def feed_queue(outbox, items):
+    for item in items:
+        outbox.put(item)
+
+
+def start_stage(name, inbox, outbox, handle, workers, feeders=()):
+    threads = [start_thread(stage_worker, f'{name}-{i}', inbox, handle) for i in range(workers)]
+
+    def finish():
+        for thread in [*threads, *feeders]:
+            thread.join()
+        outbox.put(STAGE_DONE)
+
+    return start_thread(finish, f'{name}-done')
+
+
+def run_pipeline(url, workdir=PIPELINE_WORKDIR, output_path=None, sheet_name='Images', fmt='xlsx',
+                 sitemap_url=None, browsers=DRIVER_POOL_SIZE, downloads=DOWNLOAD_WORKERS, alt_batch=PIPELINE_ALT_BATCH,
+                 rows_per_part=REPORT_ROWS_PER_PART, generate_alts=True, scheduler=None, alt_cache=None,
+                 capture_network=False, pool=None, thumbnail_executor=None, session=None, limiter=None,
+                 reencode_images=True):
+    os.makedirs(workdir, exist_ok=True)
+    output_path = output_path or os.path.join(workdir, f'report.{fmt}')
+    store = PipelineStore(os.path.join(workdir, 'pipeline.sqlite'))
+    if store.start(url):
+        progress_path = f'{os.path.splitext(output_path)[0]}.progress.json'
+        if os.path.exists(progress_path):
+            os.remove(progress_path)
+    session = session or make_session(pool_size=max(downloads, HTTP_POOL_SIZE))
+    limiter = limiter or HostLimiter(DOWNLOAD_HOST_INTERVAL, downloads)
+    cache = ImageCache(os.path.join(workdir, 'images'), fresh_for=PIPELINE_CACHE_FRESH_FOR)
+    own_alt_cache = alt_cache is None and generate_alts
+    if own_alt_cache:
+        alt_cache = AltTextCache(os.path.join(workdir, 'alt_cache.sqlite'))
+    if generate_alts:
+        scheduler = scheduler or AltTextScheduler()
+    writer = ReportWriter(output_path, sheet_name, fmt,
+                          columns=[*REPORT_COLUMNS, 'Updated Alt', 'Duplicate Of', *AUDIT_COLUMNS],
+                          rows_per_part=rows_per_part, thumbnail_dir=os.path.join(workdir, 'thumbnails'),
+                          on_checkpoint=store.set_reported)
+
+    scrape_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    download_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    alt_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    report_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    known_sources = store.known_sources()
+    known_lock = threading.Lock()
+    clusters = ImageClusterIndex()
+    for src, fingerprint in store.fingerprints():
+        clusters.add(src, fingerprint)
+    started = time.monotonic()
+
+    def discovered(page):
+        if store.add_page(page):
+            scrape_queue.put(page)
+
+    def crawl():
+        try:
+            feed_queue(scrape_queue, store.unscraped_pages())
+            if store.get_meta('crawl_status') != 'complete':
+                get_links_incremental(url, os.path.join(workdir, 'crawl_state.sqlite'), sitemap_url, session, pool,
+                                      on_page=discovered)
+                store.set_meta('crawl_status', 'complete')
+        except Exception as e:
+            logging.error(f'Pipeline crawl failed for {url}: {e}')
+        finally:
+            scrape_queue.put(STAGE_DONE)
+
+    captured = {}
+
+    def scrape(page):
+        with known_lock:
+            processed_images = set(known_sources)
+        rendered_sizes = {}
+        page_bytes = {}
+        on_image_bytes = page_bytes.__setitem__ if capture_network else None
+        with METRICS.timer('scrape.page', page):
+            result = pool.run(
+                lambda driver: scrape_page(driver, page, processed_images, None, on_image_bytes, rendered_sizes),
+                block_resources=False
+            )
+        if result is None:
+            return
+        METRICS.count('pages_scraped')
+        METRICS.count('images_found', len(result[0]))
+        new_sources = store.record_scrape(page, result[0], rendered_sizes)
+        digests = {src: cache.put_blob(page_bytes[src]) for src in new_sources if src in page_bytes}
+        with known_lock:
+            known_sources.update(new_sources)
+            captured.update(digests)
+        for src in new_sources:
+            download_queue.put(src)
+
+    def download(src):
+        with known_lock:
+            digest = captured.pop(src, None)
+        data = cache.get_blob(digest) if digest else None
+        if data is None:
+            try:
+                with METRICS.timer('download.image', src):
+                    data = cache.fetch(session, src, limiter=limiter)
+            except Exception as e:
+                logging.error(f'Failed to download image: {src}\nException: {e}')
+                METRICS.count('download_failures')
+                store.set_failed(src)
+                alt_queue.put(src)
+                return
+            METRICS.count('images_downloaded')
+        else:
+            METRICS.count('images_captured')
+        with METRICS.timer('analyze.image', src):
+            thumbnail, error, fingerprint, audit = thumbnail_executor.submit(
+                analyze_image, data, reencode_images).result()
+        if error:
+            logging.error(f'Failed to create thumbnail for {src}: {error}')
+        METRICS.count('image_bytes', audit[0])
+        cluster = clusters.add(src, fingerprint)
+        if cluster != src:
+            METRICS.count('images_clustered')
+        store.set_downloaded(src, thumbnail, fingerprint, cluster, audit)
+        alt_queue.put(src)
+
+    def describe(batch):
+        images = [store.image(src) for src in batch]
+        if not generate_alts:
+            store.set_described({image['src']: None for image in images})
+            return
+        image_clusters = {image['src']: image['cluster'] for image in images if image['status'] == 'downloaded'}
+        image_bytes = {}
+        for representative in set(image_clusters.values()):
+            digest = store.image(representative)['digest']
+            data = cache.get_blob(digest) if digest else None
+            try:
+                image_bytes[representative] = data if data is not None else cache.fetch(session, representative)
+            except Exception as e:
+                logging.error(f'Failed to read cached image: {representative}\nException: {e}')
+        rows = [(image['src'], image['src'], image['page'], image['alt']) for image in images]
+        store.set_described(generate_alt_texts(rows, image_bytes, scheduler, alt_cache, image_clusters))
+
+    def alt_stage():
+        done = False
+        while not done:
+            batch = []
+            while len(batch) < alt_batch:
+                try:
+                    item = alt_queue.get(timeout=1 if batch else None)
+                except queue.Empty:
+                    break
+                if item is STAGE_DONE:
+                    done = True
+                    break
+                batch.append(item)
+            if not batch:
+                continue
+            try:
+                with METRICS.timer('alt.batch'):
+                    describe(batch)
+            except Exception as e:
+                logging.error(f'Pipeline alt text stage failed for {len(batch)} images: {e}')
+                continue
+            for src in batch:
+                report_queue.put(src)
+        report_feeder.join()
+        report_queue.put(STAGE_DONE)
+
+    def report(src):
+        image = store.image(src)
+        thumbnail = None
+        if image['thumbnail'] is not None:
+            thumbnail = (image['thumbnail'], image['thumbnail_width'], image['thumbnail_height'])
+        duplicate_of = image['cluster'] if image['cluster'] and image['cluster'] != src else None
+        audit = audit_values(
+            (image['bytes'], image['format'], image['width'], image['height'], image['webp_bytes'],
+             image['avif_bytes']),
+            (image['rendered_width'], image['rendered_height'])
+        )
+        writer.write((image['src'], image['page'], image['alt'], image['updated_alt'], duplicate_of, *audit),
+                     thumbnail)
+
+    try:
+        with ExitStack() as resources:
+            if pool is None:
+                pool = resources.enter_context(DriverPool(size=browsers, capture_network=capture_network))
+            if thumbnail_executor is None:
+                thumbnail_executor = resources.enter_context(ProcessPoolExecutor(max_workers=THUMBNAIL_WORKERS))
+            download_feeder = start_thread(feed_queue, 'download-feed', download_queue,
+                                           store.sources_with_status('scraped'))
+            alt_feeder = start_thread(feed_queue, 'alt-feed', alt_queue,
+                                      store.sources_with_status('downloaded', 'failed'))
+            report_feeder = start_thread(feed_queue, 'report-feed', report_queue,
+                                         store.sources_with_status('described'))
+            stages = [
+                start_thread(crawl, 'crawl'),
+                start_stage('scrape', scrape_queue, download_queue, scrape, browsers, [download_feeder]),
+                start_stage('download', download_queue, alt_queue, download, downloads, [alt_feeder]),
+                start_thread(alt_stage, 'alt'),
+            ]
+            stage_worker(report_queue, report)
+            for stage in stages:
+                stage.join()
+        writer.checkpoint()
+        pages_left, images_left = store.unfinished()
+        complete = store.get_meta('crawl_status') == 'complete' and not pages_left and not images_left
+        writer.close(complete)
+        if complete:
+            store.finish()
+            logging.info(f'Pipeline for {url} finished in {time.monotonic() - started:.1f}s: {store.summary()}')
+        else:
+            logging.warning(f'Pipeline for {url} stopped after {time.monotonic() - started:.1f}s with '
+                            f'{pages_left} pages and {images_left} images unfinished: {store.summary()}. '
+                            f'Run it again to retry them')
+        cache.log_stats()
+        return writer
+    finally:
+        store.close()
+        if own_alt_cache:
+            alt_cache.close()
+
+
+class FairShare:
+    def __init__(self, slots):
+        self.slots = slots
+        self._cond = threading.Condition()
+        self._busy = 0
+        self._weights = {}
+        self._virtual_time = {}
+        self._waiting = {}
+
+    def register(self, site, weight=1):
+        with self._cond:
+            self._weights[site] = max(weight, 1)
+            self._virtual_time[site] = self._current_time()
+            self._waiting[site] = 0
+
+    def unregister(self, site):
+        with self._cond:
+            self._weights.pop(site, None)
+            self._virtual_time.pop(site, None)
+            self._waiting.pop(site, None)
+            self._cond.notify_all()
+
+    def _current_time(self):
+        waiting = [self._virtual_time[site] for site, count in self._waiting.items() if count]
+        return min(waiting, default=0.0)
+
+    def _next_site(self):
+        waiting = [site for site, count in self._waiting.items() if count]
+        return min(waiting, key=lambda site: (self._virtual_time[site], -self._weights[site]))
+
+    @contextmanager
+    def slot(self, site):
+        with self._cond:
+            if not self._waiting[site]:
+                self._virtual_time[site] = max(self._virtual_time[site], self._current_time())
+            self._waiting[site] += 1
+            while self._busy >= self.slots or self._next_site() != site:
+                self._cond.wait()
+            self._waiting[site] -= 1
+            self._busy += 1
+            self._virtual_time[site] += 1 / self._weights[site]
+            self._cond.notify_all()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._busy -= 1
+                self._cond.notify_all()
+
+
+class SitePool:
+    def __init__(self, pool, share, site):
+        self.pool = pool
+        self.share = share
+        self.site = site
+
+    def run(self, task, block_resources=None, attempts=2):
+        with self.share.slot(self.site):
+            return self.pool.run(task, block_resources, attempts)
+
+    def close(self):
+        pass
+
+
+def read_sites(urls=(), sites_file=None):
+    lines = list(urls)
+    if sites_file:
+        with open(sites_file, encoding='utf-8') as f:
+            lines.extend(f)
+    sites = []
+    for line in lines:
+        parts = re.sub(r'(^|\s)#.*', '', line).split()
+        if not parts:
+            continue
+        if len(parts) > 1:
+            if len(parts) > 2 or not parts[1].isdigit():
+                logging.warning(f'Ignoring malformed site line: {line.strip()}')
+                continue
+            sites.append((parts[0], int(parts[1])))
+        else:
+            sites.append(split_site_priority(parts[0]))
+    return sites
+
+
+def split_site_priority(site):
+    url, _, priority = site.rpartition('=')
+    query = urlsplit(url).query
+    if url and priority.isdigit() and all('=' in pair for pair in query.split('&') if pair):
+        return url, int(priority)
+    return site, 1
+
+
+def site_key(url):
+    parts = urlsplit(url)
+    readable = re.sub(r'[^\w.-]+', '_', f'{parts.netloc}{parts.path}?{parts.query}').strip('_')
+    return f'{readable}_{hashlib.sha1(url.encode("utf-8")).hexdigest()[:8]}'
+
+
+def unique_sites(sites):
+    priorities = {}
+    urls = {}
+    for url, priority in sites:
+        key = site_key(url)
+        if key in urls:
+            logging.warning(f'{url} appears more than once in the batch, running it once')
+        urls.setdefault(key, url)
+        priorities[key] = max(priority, priorities.get(key, priority))
+    return [(key, urls[key], priorities[key]) for key in urls]
+
+
+def run_batch(sites, output_dir=BATCH_DIR, fmt='xlsx', browsers=DRIVER_POOL_SIZE, downloads=DOWNLOAD_WORKERS,
+              max_sites=BATCH_MAX_SITES, requests_per_minute=ALT_REQUESTS_PER_MINUTE,
+              tokens_per_minute=ALT_TOKENS_PER_MINUTE, generate_alts=True, capture_network=False):
+    os.makedirs(output_dir, exist_ok=True)
+    share = FairShare(browsers)
+    limiter = HostLimiter(DOWNLOAD_HOST_INTERVAL, downloads)
+    session = make_session(pool_size=max(downloads * max_sites, HTTP_POOL_SIZE))
+    request_budget = RateBudget(requests_per_minute)
+    token_budget = RateBudget(tokens_per_minute)
+    alt_cache = AltTextCache(os.path.join(output_dir, 'alt_cache.sqlite')) if generate_alts else None
+    results = {}
+    started = time.monotonic()
+
+    with DriverPool(size=browsers, capture_network=capture_network) as pool, \
+            ProcessPoolExecutor(max_workers=THUMBNAIL_WORKERS) as thumbnail_executor:
+        def run_site(site):
+            key, url, priority = site
+            share.register(key, priority)
+            site_started = time.monotonic()
+            try:
+                scheduler = None
+                if generate_alts:
+                    scheduler = AltTextScheduler(request_budget=request_budget, token_budget=token_budget)
+                run_pipeline(url, os.path.join(output_dir, key), fmt=fmt,
+                             browsers=browsers, downloads=downloads, generate_alts=generate_alts,
+                             scheduler=scheduler, alt_cache=alt_cache, capture_network=capture_network,
+                             pool=SitePool(pool, share, key), thumbnail_executor=thumbnail_executor,
+                             session=session, limiter=limiter)
+                results[url] = ('complete', time.monotonic() - site_started)
+            except Exception as e:
+                logging.error(f'Batch run failed for {url}: {e}')
+                results[url] = (f'failed: {e}', time.monotonic() - site_started)
+            finally:
+                share.unregister(key)
+
+        sites = unique_sites(sites)
+        logging.info(f'Starting batch of {len(sites)} sites, {max_sites} at a time over {browsers} browsers')
+        with ThreadPoolExecutor(max_workers=max_sites) as site_executor:
+            list(site_executor.map(run_site, sorted(sites, key=lambda site: -site[2])))
+
+    if alt_cache is not None:
+        alt_cache.close()
+    logging.info(f'Batch finished in {time.monotonic() - started:.1f}s')
+    for url, (status, elapsed) in results.items():
+        logging.info(f'  {url}: {status} in {elapsed:.1f}s')
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Crawl a site, scrape its images and write alt text reports.')
+    parser.add_argument('--metrics', help='Write run metrics to this file (.prom for Prometheus text, else JSON)')
+    commands = parser.add_subparsers(dest='command')
+    run = commands.add_parser('run', help='Run the resumable crawl, scrape, download, alt text and report pipeline')
+    run.add_argument('url')
+    run.add_argument('--workdir', default=PIPELINE_WORKDIR)
+    run.add_argument('--output', help='Report path, defaults to report.<format> in the work directory')
+    run.add_argument('--sheet', default='Images')
+    run.add_argument('--format', choices=['xlsx', 'csv', 'parquet'], default='xlsx')
+    run.add_argument('--sitemap')
+    run.add_argument('--browsers', type=int, default=DRIVER_POOL_SIZE)
+    run.add_argument('--downloads', type=int, default=DOWNLOAD_WORKERS)
+    run.add_argument('--rows-per-part', type=int, default=REPORT_ROWS_PER_PART)
+    run.add_argument('--no-alt', action='store_true', help='Skip alt text generation')
+    run.add_argument('--capture-network', action='store_true',
+                     help='Collect every image the browser loads from its network log and reuse the bytes')
+    run.add_argument('--no-reencode', action='store_true',
+                     help='Skip the WebP/AVIF re-encodes behind the potential savings columns')
+    crawl = commands.add_parser('crawl', help='Crawl a site with browser workers and print the links found')
+    crawl.add_argument('url')
+    crawl.add_argument('--workers', type=int, default=CRAWL_WORKERS, help='Browser workers, 1 crawls serially')
+    crawl.add_argument('--no-sitemap', action='store_true', help='Do not seed the crawl from the site\'s sitemaps')
+    batch = commands.add_parser('batch', help='Run the pipeline for many sites over shared browsers and API budget')
+    batch.add_argument('sites', nargs='*', help='Site URLs, optionally as URL=PRIORITY')
+    batch.add_argument('--sites-file', help='File with one "URL [PRIORITY]" per line')
+    batch.add_argument('--output-dir', default=BATCH_DIR)
+    batch.add_argument('--format', choices=['xlsx', 'csv', 'parquet'], default='xlsx')
+    batch.add_argument('--browsers', type=int, default=DRIVER_POOL_SIZE)
+    batch.add_argument('--downloads', type=int, default=DOWNLOAD_WORKERS)
+    batch.add_argument('--max-sites', type=int, default=BATCH_MAX_SITES)
+    batch.add_argument('--requests-per-minute', type=int, default=ALT_REQUESTS_PER_MINUTE)
+    batch.add_argument('--tokens-per-minute', type=int, default=ALT_TOKENS_PER_MINUTE)
+    batch.add_argument('--no-alt', action='store_true', help='Skip alt text generation')
+    batch.add_argument('--capture-network', action='store_true')
+    args = parser.parse_args(argv)
+    if args.metrics:
+        METRICS.enable()
+
+    try:
+        if args.command == 'run':
+            run_pipeline(args.url, args.workdir, args.output, args.sheet, args.format, args.sitemap, args.browsers,
+                         args.downloads, rows_per_part=args.rows_per_part, generate_alts=not args.no_alt,
+                         capture_network=args.capture_network, reencode_images=not args.no_reencode)
+            return
+        if args.command == 'crawl':
+            seeds = None if args.no_sitemap else discover_urls(args.url)
+            if args.workers > 1:
+                links = get_links_parallel(args.url, args.workers, seeds=seeds)
+            else:
+                links = get_links2(args.url, seeds=seeds)
+            for link in links:
+                print(link)
+            return
+        if args.command == 'batch':
+            sites = read_sites(args.sites, args.sites_file)
+            if not sites:
+                parser.error('batch needs at least one site')
+            run_batch(sites, args.output_dir, args.format, args.browsers, args.downloads, args.max_sites,
+                      args.requests_per_minute, args.tokens_per_minute, not args.no_alt, args.capture_network)
+            return
+
+        with DriverPool() as pool:
+            url = 'https://pizzanini.no/'
+            links = get_links2(url, pool=pool, seeds=discover_urls(url))
+            for link in links:
+                print(link)
+            scrape_images(links, pool=pool)
+    finally:
+        if args.metrics:
+            METRICS.log_summary()
+            METRICS.write(args.metrics)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,102 @@
+import argparse
+import json
+import logging
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(latency, jitter, error_rate, rate_limit_rate, stats):
+    class MockCompletionHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                prompt = body['messages'][-1]['content']
+            except (ValueError, KeyError, IndexError):
+                self._send(400, {'error': {'message': 'Invalid request body'}})
+                return
+
+            with stats['lock']:
+                stats['requests'] += 1
+            time.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+
+            roll = random.random()
+            if roll < rate_limit_rate:
+                with stats['lock']:
+                    stats['rate_limited'] += 1
+                self._send(429, {'error': {'message': 'Rate limit reached'}}, {'Retry-After': '1'})
+                return
+            if roll < rate_limit_rate + error_rate:
+                with stats['lock']:
+                    stats['errors'] += 1
+                self._send(500, {'error': {'message': 'Internal server error'}})
+                return
+
+            sources = re.findall(r'Source URL: (\S+)', prompt)
+            alts = [f'Mock alt text for {source.rsplit("/", 1)[-1]}' for source in sources] or ['Mock alt text']
+            content = json.dumps(alts) if 'JSON array' in prompt else alts[0]
+            prompt_tokens = len(prompt) // 4
+            completion_tokens = len(content) // 4
+            with stats['lock']:
+                stats['tokens'] += prompt_tokens + completion_tokens
+            self._send(200, {
+                'id': 'chatcmpl-mock',
+                'object': 'chat.completion',
+                'model': body.get('model', 'mock'),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                             'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                          'total_tokens': prompt_tokens + completion_tokens},
+            })
+
+        def _send(self, status, payload, headers=None):
+            data = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            logging.debug(f'Mock completions: {format % args}')
+
+    return MockCompletionHandler
+
+
+def serve_mock_completions(port=0, latency=0.2, jitter=0.05, error_rate=0.0, rate_limit_rate=0.0):
+    stats = {'requests': 0, 'rate_limited': 0, 'errors': 0, 'tokens': 0, 'lock': threading.Lock()}
+    server = ThreadingHTTPServer(('127.0.0.1', port),
+                                 make_handler(latency, jitter, error_rate, rate_limit_rate, stats))
+    server.daemon_threads = True
+    server.stats = stats
+    server.url = f'http://127.0.0.1:{server.server_port}/v1/chat/completions'
+    thread = threading.Thread(target=server.serve_forever, name='mock-completions', daemon=True)
+    thread.start()
+    logging.info(f'Mock completions endpoint listening on {server.url}')
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local mock of the chat completions endpoint')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S')
+    server = serve_mock_completions(args.port, args.latency, args.jitter, args.error_rate, args.rate_limit_rate)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
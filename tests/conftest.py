@@ -0,0 +1,45 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fixture_site  # noqa: E402
+import mock_openai  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def site():
+    server = fixture_site.serve_fixture_site(pages=6, slow_every=0)
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def completions():
+    server = mock_openai.serve_mock_completions(latency=0.01, jitter=0)
+    yield server
+    server.shutdown()
+
+
+class FakePool:
+    def __init__(self, size=1, **kwargs):
+        self.size = size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def run(self, task, block_resources=None, attempts=2):
+        return task(None)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_pool():
+    return FakePool()
@@ -0,0 +1,96 @@
+import logging
+import time
+
+import main
+
+
+def test_parse_batch_content_accepts_plain_and_fenced_json():
+    assert main.parse_batch_content('["a", " b "]', 2) == ['a', 'b']
+    assert main.parse_batch_content('```json\n["a", "b"]\n```', 2) == ['a', 'b']
+
+
+def test_parse_batch_content_rejects_wrong_shape():
+    assert main.parse_batch_content('["a"]', 2) is None
+    assert main.parse_batch_content('{"alt": "a"}', 1) is None
+    assert main.parse_batch_content('Here are your alt texts', 1) is None
+
+
+def test_rate_budget_settles_against_actual_usage():
+    budget = main.RateBudget(1000)
+    budget.acquire(600)
+    budget.settle(600, 100)
+    started = time.monotonic()
+    budget.acquire(900)
+    assert time.monotonic() - started < 0.5
+
+
+def jobs(count):
+    return [(f'key{i}', f'https://example.com/{i}.png', 'https://example.com/', 'alt') for i in range(count)]
+
+
+def test_scheduler_is_not_throttled_by_default_token_budget(completions):
+    scheduler = main.AltTextScheduler(api_url=completions.url)
+    started = time.monotonic()
+    results = scheduler.run(jobs(30))
+    assert time.monotonic() - started < 10
+    assert len(results) == 30
+    assert completions.stats['requests'] == 30
+
+
+def test_scheduler_reports_each_run_separately(completions, caplog):
+    scheduler = main.AltTextScheduler(api_url=completions.url, batch_size=5)
+    with caplog.at_level(logging.INFO):
+        scheduler.run(jobs(10))
+        caplog.clear()
+        scheduler.run(jobs(10))
+    report = [record.getMessage() for record in caplog.records if record.getMessage().startswith('Alt text: ')]
+    assert report and report[-1].startswith('Alt text: 10 images')
+    assert ', 2 requests,' in report[-1]
+    assert scheduler.stats['images'] == 20
+    assert len(scheduler.latencies) == 2
+
+
+def test_alt_text_cache_expires_entries_after_ttl(tmp_path):
+    cache = main.AltTextCache(str(tmp_path / 'alt.sqlite'), ttl=0.05)
+    cache.put('key', 'alt')
+    assert cache.get('key') == 'alt'
+    time.sleep(0.1)
+    assert cache.get('key') is None
+    assert cache.stats == {'hits': 1, 'misses': 1, 'expired': 1, 'evicted': 0}
+    assert cache._count == 0
+    cache.close()
+
+
+def test_alt_text_cache_evicts_least_recently_used_entries(tmp_path):
+    cache = main.AltTextCache(str(tmp_path / 'alt.sqlite'), max_entries=2)
+    cache.put('a', 'alt a')
+    time.sleep(0.01)
+    cache.put('b', 'alt b')
+    time.sleep(0.01)
+    assert cache.get('a') == 'alt a'
+    time.sleep(0.01)
+    cache.put('c', 'alt c')
+    assert cache.stats['evicted'] == 1
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == ('alt a', 'alt c')
+    cache.close()
+
+
+def test_generate_alt_texts_rerun_makes_no_api_calls(tmp_path, completions):
+    rows = [(f'row{i}', f'https://example.com/{i}.png', 'https://example.com/', 'alt') for i in range(6)]
+    image_bytes = {f'https://example.com/{i}.png': f'image {i % 4}'.encode() for i in range(6)}
+    scheduler = main.AltTextScheduler(api_url=completions.url)
+
+    cache = main.AltTextCache(str(tmp_path / 'alt.sqlite'))
+    first = main.generate_alt_texts(rows, image_bytes, scheduler, cache)
+    cache.close()
+    requests = completions.stats['requests']
+    assert 0 < requests <= 4
+
+    cache = main.AltTextCache(str(tmp_path / 'alt.sqlite'))
+    second = main.generate_alt_texts(rows, image_bytes, scheduler, cache)
+    assert completions.stats['requests'] == requests
+    assert second == first
+    assert first['row0'] == first['row4']
+    assert cache.stats['hits'] == 6
+    cache.close()
@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+
+import main
+
+
+def test_read_sites_keeps_query_strings_and_priorities(tmp_path):
+    sites_file = tmp_path / 'sites.txt'
+    sites_file.write_text('# sites\nhttps://c.com/ 4  # big shop\n\nhttps://d.com/?lang=no 2\nhttps://e.com/ x\n')
+    sites = main.read_sites(['https://x.com/?lang=en', 'https://x.com/?page=2=3', 'https://y.com/=5',
+                             'https://spa.com/#/start'], str(sites_file))
+    assert sites == [
+        ('https://x.com/?lang=en', 1),
+        ('https://x.com/?page=2', 3),
+        ('https://y.com/', 5),
+        ('https://spa.com/#/start', 1),
+        ('https://c.com/', 4),
+        ('https://d.com/?lang=no', 2),
+    ]
+
+
+def test_unique_sites_keys_by_path_and_keeps_highest_priority():
+    sites = main.unique_sites([('https://x.com/', 1), ('https://x.com/no', 2), ('https://x.com/', 3)])
+    assert [(key.rsplit('_', 1)[0], url, priority) for key, url, priority in sites] == [
+        ('x.com', 'https://x.com/', 3), ('x.com_no', 'https://x.com/no', 2)]
+
+
+def test_site_key_keeps_urls_with_the_same_readable_form_apart():
+    sites = main.unique_sites([('https://x.com/a_b', 1), ('https://x.com/a?b', 1), ('https://x.com/a/b', 1)])
+    assert len({key for key, _, _ in sites}) == 3
+    assert main.site_key('https://x.com/a_b') == main.site_key('https://x.com/a_b')
+
+
+def run_fair_share(weights, grants, slots=1):
+    share = main.FairShare(slots)
+    for site, weight in weights.items():
+        share.register(site, weight)
+    order = []
+    lock = threading.Lock()
+
+    def worker(site):
+        while True:
+            with share.slot(site):
+                with lock:
+                    if len(order) >= grants:
+                        return
+                    order.append(site)
+                time.sleep(0.002)
+
+    threads = [threading.Thread(target=worker, args=(site,)) for site in weights for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return share, order
+
+
+def test_fair_share_splits_slots_by_priority():
+    _, order = run_fair_share({'big': 3, 'small': 1}, 80)
+    steady = order[8:]
+    assert steady.count('big') == pytest.approx(3 * steady.count('small'), rel=0.35)
+
+
+def test_fair_share_lets_others_continue_after_unregister():
+    share, _ = run_fair_share({'a': 1, 'b': 1}, 10)
+    share.unregister('a')
+    with share.slot('b'):
+        pass
+    share.register('c', 1)
+    with share.slot('c'):
+        pass
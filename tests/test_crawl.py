@@ -0,0 +1,260 @@
+import time
+
+import pytest
+
+import main
+
+SITE = 'https://example.com/'
+
+
+def test_canonicalize_url_normalizes_host_path_and_query():
+    assert main.canonicalize_url('https://WWW.Example.com:443//a//b/?b=2&a=1') == '//example.com/a/b?a=1&b=2'
+    assert main.canonicalize_url('http://example.com:8080/') == '//example.com:8080/'
+
+
+def test_canonicalize_url_drops_tracking_params():
+    url = 'https://example.com/shop?utm_source=x&id=3&fbclid=abc&gclid=1'
+    assert main.canonicalize_url(url) == '//example.com/shop?id=3'
+
+
+def test_canonicalize_url_allow_list_and_path_case():
+    url = 'https://example.com/Shop?page=2&sort=asc'
+    assert main.canonicalize_url(url, allow_params={'page'}) == '//example.com/Shop?page=2'
+    assert main.canonicalize_url(url, lowercase_path=True) == '//example.com/shop?page=2&sort=asc'
+
+
+def test_seen_set_add_and_contains():
+    seen = main.SeenSet(capacity=4)
+    assert seen.add('a')
+    assert not seen.add('a')
+    assert 'a' in seen
+    assert 'b' not in seen
+    assert len(seen) == 1
+
+
+def test_seen_set_grows_without_losing_keys():
+    seen = main.SeenSet(capacity=4)
+    keys = [f'//example.com/page/{i}' for i in range(5000)]
+    assert all(seen.add(key) for key in keys)
+    assert len(seen) == len(keys)
+    assert all(key in seen for key in keys)
+    assert not any(seen.add(key) for key in keys[::97])
+
+
+def test_link_tracker_drops_rel_canonical_duplicates():
+    tracker = main.LinkTracker(seeds=['https://example.com/a?utm_source=x', 'https://example.com/b'])
+    assert tracker.seeds == ['https://example.com/a?utm_source=x', 'https://example.com/b']
+    assert not tracker.add('https://example.com/a')
+    assert tracker.add('https://example.com/a-copy')
+
+    assert tracker.claim('https://example.com/a')
+    assert not tracker.resolve_canonical('https://example.com/a', 'https://example.com/a')
+    assert tracker.claim('https://example.com/a-copy')
+    assert tracker.resolve_canonical('https://example.com/a-copy', 'https://example.com/a/')
+    assert tracker.unique_links() == ['https://example.com/a?utm_source=x', 'https://example.com/b']
+
+
+def test_link_tracker_marks_new_canonical_as_crawled():
+    tracker = main.LinkTracker()
+    assert tracker.claim('https://example.com/?page=1')
+    assert not tracker.resolve_canonical('https://example.com/?page=1', 'https://example.com/home')
+    assert not tracker.claim('https://example.com/home')
+
+
+class FakeSite:
+    def __init__(self, monkeypatch, pages, canonicals=None, seeds=(), lastmods=None):
+        self.pages = {main.canonicalize_url(url): links for url, links in pages.items()}
+        self.canonicals = canonicals or {}
+        self.seeds = list(seeds)
+        self.lastmods = lastmods or {}
+        self.versions = {}
+        self.not_modified = set()
+        self.broken = set()
+        self.rendered = []
+        monkeypatch.setattr(main, 'discover_urls', self.discover_urls)
+        monkeypatch.setattr(main, 'check_not_modified', self.check_not_modified)
+        monkeypatch.setattr(main, 'crawl_page_with_hash', self.crawl_page)
+
+    def discover_urls(self, url, session=None, sitemap_urls=None, canonicalize=main.canonicalize_url, lastmods=None):
+        lastmods.update({canonicalize(loc): lastmod for loc, lastmod in self.lastmods.items()})
+        return self.seeds
+
+    def check_not_modified(self, session, url, page):
+        return page is not None and url in self.not_modified, '"v1"', None
+
+    def crawl_page(self, web_driver, url, domain):
+        self.rendered.append(url)
+        if url in self.broken:
+            raise RuntimeError(f'Could not load {url}')
+        key = main.canonicalize_url(url)
+        return list(self.pages[key]), f'{key}:{self.versions.get(key, 0)}', self.canonicals.get(url)
+
+    def crawl(self, state_path, pool, on_page=None):
+        self.rendered = []
+        return main.get_links_incremental(SITE, str(state_path), session=object(), pool=pool, on_page=on_page)
+
+
+def keys(urls):
+    return sorted(main.canonicalize_url(url) for url in urls)
+
+
+def test_incremental_crawl_keys_pages_canonically(tmp_path, fake_pool, monkeypatch):
+    site = FakeSite(monkeypatch, {
+        SITE: ['https://www.example.com/a/', 'https://example.com/a?utm_source=mail', 'https://example.com/b'],
+        'https://example.com/a': [SITE],
+        'https://example.com/b': ['https://example.com/a'],
+        'https://example.com/c': [],
+    }, canonicals={'https://example.com/b': 'https://example.com/a'},
+        seeds=['https://example.com/c', 'https://example.com/?utm_campaign=x'])
+    pages = []
+    links = site.crawl(tmp_path / 'crawl.sqlite', fake_pool, on_page=pages.append)
+
+    assert len(site.rendered) == 4
+    assert keys(site.rendered) == keys([SITE, 'https://example.com/a', 'https://example.com/b',
+                                        'https://example.com/c'])
+    assert keys(pages) == keys([SITE, 'https://example.com/a', 'https://example.com/c'])
+    assert keys(links) == keys(pages)
+
+
+
+class Crash(BaseException):
+    pass
+
+
+def chain_site(monkeypatch, count=4):
+    urls = [SITE] + [f'{SITE}p{index}' for index in range(1, count)]
+    pages = {url: urls[index + 1:index + 2] for index, url in enumerate(urls)}
+    return FakeSite(monkeypatch, pages), urls
+
+
+def test_incremental_crawl_resumes_from_saved_frontier(tmp_path, fake_pool, monkeypatch):
+    site, urls = chain_site(monkeypatch)
+    crawl_page = site.crawl_page
+
+    def crashing_crawl_page(web_driver, url, domain):
+        if url == urls[2]:
+            raise Crash()
+        return crawl_page(web_driver, url, domain)
+
+    monkeypatch.setattr(main, 'crawl_page_with_hash', crashing_crawl_page)
+    with pytest.raises(Crash):
+        site.crawl(tmp_path / 'crawl.sqlite', fake_pool)
+    assert site.rendered == urls[:2]
+
+    monkeypatch.setattr(main, 'crawl_page_with_hash', crawl_page)
+    links = site.crawl(tmp_path / 'crawl.sqlite', fake_pool)
+    assert site.rendered == urls[2:]
+    assert keys(links) == keys(urls)
+
+
+def test_incremental_crawl_skips_pages_older_than_sitemap_lastmod(tmp_path, fake_pool, monkeypatch):
+    site, urls = chain_site(monkeypatch)
+    site.lastmods = {url: 1.0 for url in urls}
+    site.crawl(tmp_path / 'crawl.sqlite', fake_pool)
+    assert site.rendered == urls
+
+    site.lastmods[urls[1]] = time.time() + 60
+    pages = []
+    links = site.crawl(tmp_path / 'crawl.sqlite', fake_pool, on_page=pages.append)
+    assert site.rendered == [urls[1]]
+    assert pages == urls
+    assert keys(links) == keys(urls)
+
+
+def test_incremental_crawl_reuses_links_of_not_modified_pages(tmp_path, fake_pool, monkeypatch):
+    site, urls = chain_site(monkeypatch)
+    site.crawl(tmp_path / 'crawl.sqlite', fake_pool)
+    site.not_modified = set(urls[:3])
+    links = site.crawl(tmp_path / 'crawl.sqlite', fake_pool)
+    assert site.rendered == [urls[3]]
+    assert keys(links) == keys(urls)
+
+    state = main.CrawlState(str(tmp_path / 'crawl.sqlite'))
+    assert state.page(urls[1])['etag'] == '"v1"'
+    assert state.page_links(urls[1]) == [urls[2]]
+    state.close()
+
+
+def test_incremental_crawl_keeps_links_of_pages_that_fail_to_load(tmp_path, fake_pool, monkeypatch):
+    site, urls = chain_site(monkeypatch)
+    site.crawl(tmp_path / 'crawl.sqlite', fake_pool)
+    site.broken = {urls[1]}
+    links = site.crawl(tmp_path / 'crawl.sqlite', fake_pool)
+    assert site.rendered == urls
+    assert keys(links) == keys(urls)
+
+    state = main.CrawlState(str(tmp_path / 'crawl.sqlite'))
+    assert state.page_links(urls[1]) == [urls[2]]
+    state.close()
+
+
+def test_incremental_crawl_retries_new_pages_that_fail_to_load(tmp_path, fake_pool, monkeypatch):
+    site, urls = chain_site(monkeypatch)
+    site.broken = {urls[1]}
+    links = site.crawl(tmp_path / 'crawl.sqlite', fake_pool)
+    assert site.rendered == urls[:2]
+    assert keys(links) == keys(urls[:2])
+
+    site.broken = set()
+    links = site.crawl(tmp_path / 'crawl.sqlite', fake_pool)
+    assert keys(links) == keys(urls)
+
+
+def test_pages_to_scrape_only_returns_new_or_changed_pages(tmp_path, fake_pool, monkeypatch):
+    site, urls = chain_site(monkeypatch)
+    path = tmp_path / 'crawl.sqlite'
+    site.crawl(path, fake_pool)
+    state = main.CrawlState(str(path))
+    assert keys(state.pages_to_scrape()) == keys(urls)
+    for url in urls:
+        state.record_images(url, [(f'{url}.png', url, 'alt')])
+    assert state.pages_to_scrape() == []
+    state.close()
+
+    site.versions[main.canonicalize_url(urls[2])] = 1
+    site.crawl(path, fake_pool)
+    state = main.CrawlState(str(path))
+    assert state.pages_to_scrape() == [urls[2]]
+    assert len(state.current_images()) == len(urls)
+    state.close()
+
+
+def link_graph(count=20):
+    pages = {SITE: [f'{SITE}p{index}' for index in range(1, 6)]
+             + ['https://www.example.com/p2/', f'{SITE}p3?utm_source=mail', f'{SITE}p1-print']}
+    for index in range(1, count):
+        pages[f'{SITE}p{index}'] = [f'{SITE}p{child}' for child in (index * 2, index * 2 + 1) if child < count] + [SITE]
+    pages[f'{SITE}p1-print'] = []
+    return {main.canonicalize_url(url): links for url, links in pages.items()}
+
+
+def fake_crawl_page(graph, rendered):
+    def crawl_page_with_canonical(web_driver, current_url, domain, limiter=None):
+        rendered.append(current_url)
+        canonical = f'{SITE}p1' if current_url.endswith('p1-print') else None
+        return list(graph[main.canonicalize_url(current_url)]), canonical
+    return crawl_page_with_canonical
+
+
+def test_parallel_crawl_matches_serial_crawl(fake_pool, monkeypatch):
+    graph = link_graph()
+    serial_rendered, parallel_rendered = [], []
+    monkeypatch.setattr(main, 'crawl_page_with_canonical', fake_crawl_page(graph, serial_rendered))
+    serial = main.get_links2(SITE, pool=fake_pool)
+    monkeypatch.setattr(main, 'crawl_page_with_canonical', fake_crawl_page(graph, parallel_rendered))
+    parallel = main.get_links_parallel(SITE, workers=4, pool=fake_pool)
+
+    assert keys(parallel) == keys(serial)
+    assert len(keys(serial)) == len(set(keys(serial))) == 20
+    assert len(serial_rendered) == len(set(keys(serial_rendered)))
+    assert len(parallel_rendered) == len(set(keys(parallel_rendered)))
+
+
+def test_crawl_command_uses_parallel_workers(monkeypatch, capsys):
+    calls = []
+    monkeypatch.setattr(main, 'get_links_parallel', lambda url, workers, seeds=None: calls.append(workers) or [url])
+    monkeypatch.setattr(main, 'get_links2', lambda url, seeds=None: calls.append(1) or [url])
+    main.main(['crawl', SITE, '--workers', '3', '--no-sitemap'])
+    main.main(['crawl', SITE, '--workers', '1', '--no-sitemap'])
+    assert calls == [3, 1]
+    assert capsys.readouterr().out.split() == [SITE, SITE]
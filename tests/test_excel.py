@@ -0,0 +1,16 @@
+import main
+
+
+def test_excel_flow_downloads_each_image_once(tmp_path, site, completions):
+    page = f'{site.url}page/0.html'
+    images = [(f'{site.url}img/x{index}.jpg', page, f'Photo {index}') for index in range(4)]
+    excel_path = str(tmp_path / 'report.xlsx')
+    requests_before = site.stats['images']
+
+    image_bytes = main.write_to_excel(images, excel_path, 'Images')
+    assert sorted(image_bytes) == [image[0] for image in images]
+    scheduler = main.AltTextScheduler(api_url=completions.url)
+    main.alt_writer(excel_path, 'Images', None, image_bytes=image_bytes, scheduler=scheduler)
+
+    assert site.stats['images'] - requests_before == len(images)
+    assert completions.stats['requests'] > 0
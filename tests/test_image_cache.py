@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import main
+
+
+class ImageServer:
+    def __init__(self):
+        self.images = {}
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                data, etag = server.images[self.path]
+                not_modified = etag is not None and self.headers.get('If-None-Match') == etag
+                server.requests.append((self.path, 304 if not_modified else 200))
+                self.send_response(304 if not_modified else 200)
+                if etag is not None:
+                    self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0' if not_modified else str(len(data)))
+                self.end_headers()
+                if not not_modified:
+                    self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def add(self, path, data, etag=None):
+        self.images[path] = (data, etag)
+        return f'{self.url}{path}'
+
+    def statuses(self, path):
+        return [status for requested, status in self.requests if requested == path]
+
+
+@pytest.fixture
+def server():
+    server = ImageServer()
+    yield server
+    server.httpd.shutdown()
+
+
+@pytest.fixture
+def session():
+    return main.make_session(pool_size=2)
+
+
+def blob_files(directory):
+    return [name for _, _, names in os.walk(directory) for name in names if name != 'index.sqlite']
+
+
+def test_image_cache_revalidates_with_etag(tmp_path, server, session):
+    cache = main.ImageCache(str(tmp_path))
+    url = server.add('/a.png', b'first', etag='"v1"')
+    assert cache.fetch(session, url) == b'first'
+    assert cache.fetch(session, url) == b'first'
+    assert server.statuses('/a.png') == [200, 304]
+
+    server.add('/a.png', b'second version', etag='"v2"')
+    assert cache.fetch(session, url) == b'second version'
+    assert server.statuses('/a.png') == [200, 304, 200]
+    assert cache.stats == {'hits': 1, 'revalidated': 1, 'misses': 2, 'deduplicated': 0, 'evicted': 0,
+                           'bytes_downloaded': len(b'first') + len(b'second version'), 'bytes_served': len(b'first')}
+    cache.close()
+
+
+def test_image_cache_serves_fresh_entries_without_a_request(tmp_path, server, session):
+    cache = main.ImageCache(str(tmp_path), fresh_for=3600)
+    url = server.add('/a.png', b'image', etag='"v1"')
+    assert cache.fetch(session, url) == b'image'
+    assert cache.fetch(session, url) == b'image'
+    assert server.statuses('/a.png') == [200]
+    assert (cache.stats['hits'], cache.stats['revalidated'], cache.stats['bytes_served']) == (1, 0, 5)
+    cache.close()
+
+
+def test_image_cache_stores_identical_bytes_once(tmp_path, server, session):
+    cache = main.ImageCache(str(tmp_path))
+    first = server.add('/a.png', b'same bytes')
+    second = server.add('/copy/a.png', b'same bytes')
+    assert cache.fetch(session, first) == cache.fetch(session, second) == b'same bytes'
+    assert cache.stats['deduplicated'] == 1
+    assert cache.stats['misses'] == 2
+    assert len(blob_files(str(tmp_path))) == 1
+    assert cache._total == len(b'same bytes')
+    cache.close()
+
+
+def test_image_cache_evicts_least_recently_used(tmp_path, server, session):
+    cache = main.ImageCache(str(tmp_path), max_bytes=25, fresh_for=3600)
+    urls = {name: server.add(f'/{name}.png', name.encode() * 10) for name in 'abc'}
+    cache.fetch(session, urls['a'])
+    time.sleep(0.01)
+    cache.fetch(session, urls['b'])
+    time.sleep(0.01)
+    cache.fetch(session, urls['a'])
+    time.sleep(0.01)
+    cache.fetch(session, urls['c'])
+    assert cache.stats['evicted'] == 1
+    assert cache._total == 20
+    assert len(blob_files(str(tmp_path))) == 2
+
+    cache.fetch(session, urls['a'])
+    cache.fetch(session, urls['b'])
+    assert server.statuses('/a.png') == [200]
+    assert server.statuses('/b.png') == [200, 200]
+    cache.close()
+
+
+@pytest.mark.parametrize('fresh_for', [0, 3600])
+def test_image_cache_refetches_a_missing_blob(tmp_path, server, session, fresh_for):
+    cache = main.ImageCache(str(tmp_path), fresh_for=fresh_for)
+    url = server.add('/a.png', b'image', etag='"v1"')
+    assert cache.fetch(session, url) == b'image'
+    for name in blob_files(str(tmp_path)):
+        os.remove(cache._blob_path(name))
+
+    assert cache.fetch(session, url) == b'image'
+    assert server.statuses('/a.png') == ([200, 304, 200] if not fresh_for else [200, 200])
+    assert (cache.stats['hits'], cache.stats['misses']) == (0, 2)
+    assert len(blob_files(str(tmp_path))) == 1
+    assert cache._total == len(b'image')
+    assert cache.fetch(session, url) == b'image'
+    assert cache.stats['hits'] == 1
+    cache.close()
@@ -0,0 +1,87 @@
+import random
+from io import BytesIO
+
+from PIL import Image as PILImage, ImageDraw
+
+import main
+
+
+def drawing(seed, size=(320, 240), image_format='PNG'):
+    rng = random.Random(seed)
+    img = PILImage.new('RGB', (320, 240), (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    for _ in range(6):
+        x, y = rng.randrange(280), rng.randrange(200)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        draw.ellipse((x, y, x + rng.randrange(40, 160), y + rng.randrange(40, 120)), fill=color)
+    if size != img.size:
+        img = img.resize(size, PILImage.Resampling.LANCZOS)
+    buffer = BytesIO()
+    img.save(buffer, format=image_format, **({'quality': 85} if image_format == 'JPEG' else {}))
+    return buffer.getvalue()
+
+
+def test_bk_tree_matches_brute_force():
+    rng = random.Random(1)
+    values = [rng.getrandbits(64) for _ in range(500)]
+    tree = main.BKTree()
+    for index, value in enumerate(values):
+        tree.add(value, index)
+    for query in values[:20] + [rng.getrandbits(64) for _ in range(20)]:
+        for max_distance in (0, 8, 24):
+            expected = sorted((main.hamming_distance(value, query), index) for index, value in enumerate(values)
+                              if main.hamming_distance(value, query) <= max_distance)
+            assert sorted(tree.search(query, max_distance)) == expected
+
+
+def test_cluster_index_groups_resized_and_reencoded_copies():
+    original = drawing(1)
+    copies = {
+        'original.png': original,
+        'exact-copy.png': original,
+        'small.jpg': drawing(1, (160, 120), 'JPEG'),
+        'other.png': drawing(2),
+        'stretched.png': drawing(1, (320, 120)),
+    }
+    index = main.ImageClusterIndex()
+    clusters = {source: index.add(source, main.image_fingerprint(data)) for source, data in copies.items()}
+    assert clusters['exact-copy.png'] == 'original.png'
+    assert clusters['small.jpg'] == 'original.png'
+    assert clusters['other.png'] == 'other.png'
+    assert clusters['stretched.png'] == 'stretched.png'
+
+
+def test_fingerprint_skips_flat_and_tiny_images():
+    buffer = BytesIO()
+    PILImage.new('RGB', (200, 200), (10, 10, 10)).save(buffer, format='PNG')
+    assert main.image_fingerprint(buffer.getvalue())[1] is None
+    buffer = BytesIO()
+    PILImage.effect_noise((16, 16), 80).save(buffer, format='PNG')
+    assert main.image_fingerprint(buffer.getvalue())[1] is None
+
+
+def test_analyze_image_returns_thumbnail_fingerprint_and_audit():
+    data = drawing(3, (640, 480), 'JPEG')
+    thumbnail, error, fingerprint, audit = main.analyze_image(data, reencode=False)
+    assert error is None
+    assert thumbnail[1:] == (100, 75)
+    assert fingerprint[0] == main.image_fingerprint(data)[0]
+    assert fingerprint[1] is not None
+    assert audit == (len(data), 'JPEG', 640, 480, None, None)
+
+    _, _, _, audit = main.analyze_image(data)
+    assert audit[:4] == (len(data), 'JPEG', 640, 480)
+    assert audit[4] > 0
+
+
+def test_analyze_image_reports_unreadable_bytes():
+    thumbnail, error, fingerprint, audit = main.analyze_image(b'not an image')
+    assert thumbnail is None and error
+    assert fingerprint[1] is None
+    assert audit == (12, None, None, None, None, None)
+
+
+def test_audit_values_formats_sizes_and_savings():
+    values = main.audit_values((1000, 'PNG', 800, 600, 400, 300), (200, 150))
+    assert values == (1000, 'PNG', '800x600', '200x150', 400, 300, 700)
+    assert main.audit_values((1000, 'PNG', 800, 600, None, None), (0, 0))[3:] == (None, None, None, None)
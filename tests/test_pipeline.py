@@ -0,0 +1,245 @@
+import csv
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import main
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHILD = """
+import os
+import sys
+
+sys.path.insert(0, sys.argv[1])
+import main
+from conftest import FakePool
+
+site_url, workdir, crash_at = sys.argv[2], sys.argv[3], int(sys.argv[4])
+pages = [f'{site_url}page/{number}.html' for number in range(6)]
+
+
+def crawl(url, state_path, sitemap_url, session, pool, on_page=None):
+    for page in pages:
+        on_page(page)
+    return pages
+
+
+def scrape(driver, page, processed_images, interactions=None, on_image_bytes=None, rendered_sizes=None):
+    number = page.rsplit('/', 1)[1].split('.')[0]
+    images = [(f'{site_url}img/p{number}-{index}.jpg', page, f'Photo {index}') for index in range(3)]
+    images += [(f'{site_url}img/logo.png', page, 'Logo'), (f'{site_url}img/missing.gif', page, '')]
+    return [image for image in images if image[0] not in processed_images], processed_images
+
+
+writes = {'count': 0}
+write = main.ReportWriter.write
+
+
+def crashing_write(self, values, thumbnail=None):
+    writes['count'] += 1
+    if writes['count'] == crash_at:
+        os._exit(3)
+    return write(self, values, thumbnail)
+
+
+main.DriverPool = FakePool
+main.get_links_incremental = crawl
+main.scrape_page = scrape
+main.ReportWriter.write = crashing_write
+main.run_pipeline(site_url, workdir, fmt='csv', rows_per_part=4, reencode_images=False)
+"""
+
+
+def test_pipeline_store_status_transitions(tmp_path):
+    store = main.PipelineStore(str(tmp_path / 'pipeline.sqlite'))
+    assert store.start('https://example.com/')
+    assert store.add_page('https://example.com/a')
+    assert not store.add_page('https://example.com/a')
+    images = [('https://example.com/1.png', 'https://example.com/a', 'one'),
+              ('https://example.com/2.png', 'https://example.com/a', 'two')]
+    assert store.record_scrape('https://example.com/a', images, {'https://example.com/1.png': (10, 20)}) == [
+        'https://example.com/1.png', 'https://example.com/2.png']
+    assert store.record_scrape('https://example.com/a', images) == []
+    assert store.unscraped_pages() == []
+
+    store.set_downloaded('https://example.com/1.png', None, ('digest', 255, 1.0), 'https://example.com/1.png',
+                         (100, 'PNG', 10, 20, None, None))
+    store.set_failed('https://example.com/2.png')
+    assert store.sources_with_status('downloaded', 'failed') == ['https://example.com/1.png',
+                                                                 'https://example.com/2.png']
+    assert store.fingerprints() == [('https://example.com/1.png', ('digest', 255, 1.0))]
+    store.set_described({'https://example.com/1.png': 'new alt', 'https://example.com/2.png': None})
+    store.set_reported(['https://example.com/1.png'])
+    image = store.image('https://example.com/1.png')
+    assert (image['status'], image['updated_alt'], image['rendered_width'], image['bytes']) == (
+        'reported', 'new alt', 10, 100)
+    assert store.sources_with_status('described') == ['https://example.com/2.png']
+
+    assert not store.start('https://example.com/')
+    store.finish()
+    assert store.start('https://example.com/')
+    assert store.known_sources() == set()
+    store.close()
+
+
+def test_pipeline_store_keys_pages_canonically(tmp_path):
+    store = main.PipelineStore(str(tmp_path / 'pipeline.sqlite'))
+    store.start('https://example.com/')
+    assert store.add_page('https://example.com/a')
+    assert not store.add_page('https://www.example.com/a/?utm_source=mail')
+    store.record_scrape('https://www.example.com/a/', [])
+    assert store.unscraped_pages() == []
+    store.close()
+
+
+def test_report_writer_resumes_from_last_checkpoint(tmp_path):
+    output = str(tmp_path / 'report.csv')
+    writer = main.ReportWriter(output, fmt='csv', rows_per_part=2)
+    for index in range(5):
+        writer.write((f'src{index}', 'page', 'alt'))
+    writer._csv_file.flush()
+
+    writer = main.ReportWriter(output, fmt='csv', rows_per_part=2)
+    assert writer.rows_written == 4
+    writer.write(('src4', 'page', 'alt'))
+    writer.close()
+    with open(output, newline='') as f:
+        rows = list(csv.reader(f))
+    assert [row[1] for row in rows[1:]] == [f'src{index}' for index in range(5)]
+    with open(str(tmp_path / 'report.progress.json')) as f:
+        assert json.load(f)['complete']
+
+    writer = main.ReportWriter(output, fmt='csv', rows_per_part=2)
+    assert writer.rows_written == 0
+    writer.close()
+
+
+def test_report_writer_checkpoints_only_written_rows(tmp_path, monkeypatch):
+    checkpoints = []
+    writer = main.ReportWriter(str(tmp_path / 'report.csv'), fmt='csv', rows_per_part=2,
+                               on_checkpoint=checkpoints.append)
+
+    def failing_save(source, thumbnail):
+        raise OSError('disk full')
+
+    writer.write(('src0', 'page', 'alt'))
+    monkeypatch.setattr(writer, '_save_thumbnail', failing_save)
+    with pytest.raises(OSError):
+        writer.write(('src1', 'page', 'alt'), (b'png', 10, 10))
+    monkeypatch.undo()
+    writer.write(('src2', 'page', 'alt'))
+    writer.write(('src3', 'page', 'alt'))
+    writer.close()
+    assert checkpoints == [['src0', 'src2'], ['src3']]
+
+
+def run_child(site, completions, workdir, crash_at):
+    env = dict(os.environ, CHATGPT_API_URL=completions.url)
+    return subprocess.run([sys.executable, '-c', CHILD, ROOT, site.url, str(workdir), str(crash_at)],
+                          cwd=os.path.join(ROOT, 'tests'), env=env, timeout=120).returncode
+
+
+def test_pipeline_resumes_after_crash(tmp_path, site, completions):
+    workdir = tmp_path / 'run'
+    assert run_child(site, completions, workdir, 7) == 3
+    first_run_requests = completions.stats['requests']
+    assert first_run_requests > 0
+
+    assert run_child(site, completions, workdir, 0) == 0
+    with open(workdir / 'report.csv', newline='') as f:
+        rows = list(csv.DictReader(f))
+    sources = [row['Src'] for row in rows]
+    assert len(sources) == len(set(sources)) == 6 * 3 + 2
+    updated = {row['Src']: row['Updated Alt'] for row in rows}
+    assert updated[f'{site.url}img/missing.gif'] == 'Could not fetch the image'
+    assert all(alt.startswith('Mock alt text') for source, alt in updated.items() if 'missing' not in source)
+    assert completions.stats['requests'] - first_run_requests < 6 * 3 + 1
+    assert all(row['Format'] for row in rows if 'missing' not in row['Src'])
+
+    store = main.PipelineStore(str(workdir / 'pipeline.sqlite'))
+    assert store.get_meta('status') == 'complete'
+    assert set(store.sources_with_status('reported')) == set(sources)
+    store.close()
+
+
+def test_pipeline_leaves_failed_work_for_the_next_run(tmp_path, site, fake_pool, monkeypatch):
+    workdir = tmp_path / 'run'
+    pages = [f'{site.url}page/{number}.html' for number in range(3)]
+    failures = {'scrape': {pages[1]}, 'describe': 1}
+
+    def crawl(url, state_path, sitemap_url, session, pool, on_page=None):
+        for page in pages:
+            on_page(page)
+        return pages
+
+    def scrape(driver, page, processed_images, interactions=None, on_image_bytes=None, rendered_sizes=None):
+        if page in failures['scrape']:
+            failures['scrape'].remove(page)
+            raise RuntimeError('renderer crashed')
+        number = page.rsplit('/', 1)[1].split('.')[0]
+        images = [(f'{site.url}img/p{number}-{index}.jpg', page, '') for index in range(2)]
+        return [image for image in images if image[0] not in processed_images], processed_images
+
+    def generate(rows, image_bytes, scheduler=None, alt_cache=None, clusters=None):
+        if failures['describe']:
+            failures['describe'] -= 1
+            raise RuntimeError('rate limited')
+        return {row[0]: 'Described' for row in rows}
+
+    monkeypatch.setattr(main, 'get_links_incremental', crawl)
+    monkeypatch.setattr(main, 'scrape_page', scrape)
+    monkeypatch.setattr(main, 'generate_alt_texts', generate)
+
+    def run():
+        with ThreadPoolExecutor() as executor:
+            main.run_pipeline(site.url, str(workdir), fmt='csv', alt_batch=2, rows_per_part=2, pool=fake_pool,
+                              thumbnail_executor=executor, reencode_images=False)
+        store = main.PipelineStore(str(workdir / 'pipeline.sqlite'))
+        try:
+            return store.get_meta('status'), store.unfinished()
+        finally:
+            store.close()
+
+    status, (pages_left, images_left) = run()
+    assert status == 'running' and pages_left == 1 and images_left
+    assert run() == ('complete', (0, 0))
+    with open(workdir / 'report.csv', newline='') as f:
+        rows = list(csv.DictReader(f))
+    sources = [row['Src'] for row in rows]
+    assert len(sources) == len(set(sources)) == 3 * 2
+    assert all(row['Updated Alt'] == 'Described' for row in rows)
+
+
+def test_pipeline_uses_captured_bytes_for_this_run_only(tmp_path, site, fake_pool, monkeypatch):
+    workdir = tmp_path / 'run'
+    page = f'{site.url}page/0.html'
+    captured_src, fetched_src = f'{site.url}img/p0-0.jpg', f'{site.url}img/p0-1.jpg'
+    captured = b'captured srcset variant'
+
+    def crawl(url, state_path, sitemap_url, session, pool, on_page=None):
+        on_page(page)
+        return [page]
+
+    def scrape(driver, page, processed_images, interactions=None, on_image_bytes=None, rendered_sizes=None):
+        on_image_bytes(captured_src, captured)
+        return [(captured_src, page, ''), (fetched_src, page, '')], processed_images
+
+    monkeypatch.setattr(main, 'get_links_incremental', crawl)
+    monkeypatch.setattr(main, 'scrape_page', scrape)
+    requests_before = site.stats['images']
+    with ThreadPoolExecutor() as executor:
+        main.run_pipeline(site.url, str(workdir), fmt='csv', pool=fake_pool, thumbnail_executor=executor,
+                          generate_alts=False, capture_network=True, reencode_images=False)
+
+    assert site.stats['images'] - requests_before == 1
+    store = main.PipelineStore(str(workdir / 'pipeline.sqlite'))
+    assert store.image(captured_src)['bytes'] == len(captured)
+    store.close()
+    cache = main.ImageCache(str(workdir / 'images'))
+    assert cache._lookup(captured_src) is None
+    assert cache._lookup(fetched_src) is not None
+    cache.close()
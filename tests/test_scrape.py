@@ -0,0 +1,70 @@
+import base64
+import json
+from io import BytesIO
+
+from PIL import Image as PILImage
+
+import main
+
+PAGE = 'https://example.com/shop'
+
+
+def image_bytes(size, image_format='PNG'):
+    buffer = BytesIO()
+    PILImage.new('RGB', size, (200, 30, 30)).save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+class NetworkDriver:
+    def __init__(self, responses):
+        self.entries = []
+        self.bodies = {}
+        for index, (url, data) in enumerate(responses):
+            request_id = str(index)
+            self.bodies[request_id] = data
+            self.log('Network.responseReceived', requestId=request_id, type='Image',
+                     response={'url': url, 'status': 200, 'mimeType': 'image/png'})
+            self.log('Network.loadingFinished', requestId=request_id, encodedDataLength=len(data))
+
+    def log(self, method, **params):
+        self.entries.append({'message': json.dumps({'message': {'method': method, 'params': params}})})
+
+    def get_log(self, kind):
+        entries, self.entries = self.entries, []
+        return entries
+
+    def execute_cdp_cmd(self, command, params):
+        return {'body': base64.b64encode(self.bodies[params['requestId']]).decode('ascii'), 'base64Encoded': True}
+
+
+def test_add_network_images_skips_tracking_pixels_and_beacons():
+    hero = image_bytes((64, 48))
+    banner = image_bytes((300, 100))
+    driver = NetworkDriver([
+        ('https://example.com/img/hero-2x.jpg', hero),
+        ('https://www.facebook.com/tr?id=1&ev=PageView', image_bytes((40, 40), 'GIF')),
+        ('https://example.com/spacer.gif', image_bytes((1, 1), 'GIF')),
+        ('https://stats.example.net/pixel?page=shop', b'GIF89a'),
+        ('https://cdn.example.net/banner.png?w=800', banner),
+        ('https://example.com/bg.png', banner),
+    ])
+    page_images = []
+    processed_images = {'https://example.com/img/hero.jpg'}
+    captured = {}
+    sources = {'https://example.com/img/hero-2x.jpg': 'https://example.com/img/hero.jpg'}
+    main.add_network_images(driver, PAGE, page_images, processed_images, captured.__setitem__, sources)
+
+    assert page_images == [('https://cdn.example.net/banner.png?w=800', PAGE, 'No Alt'),
+                           ('https://example.com/bg.png', PAGE, 'No Alt')]
+    assert captured == {'https://example.com/img/hero.jpg': hero,
+                        'https://cdn.example.net/banner.png?w=800': banner,
+                        'https://example.com/bg.png': banner}
+
+
+def test_is_tracking_image_keeps_small_icons_and_svg():
+    record = {'src': 'https://example.com/icon.png', 'data': image_bytes((16, 16))}
+    assert not main.is_tracking_image(record, 'example.com')
+    record = {'src': 'https://example.com/logo.svg', 'data': b'<svg xmlns="http://www.w3.org/2000/svg"/>'}
+    assert not main.is_tracking_image(record, 'example.com')
+    record = {'src': 'https://example.com/pixel.gif', 'data': None}
+    assert not main.is_tracking_image(record, 'example.com')